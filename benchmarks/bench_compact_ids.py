@@ -0,0 +1,61 @@
+"""
+Reports the memory used by the main Service_Utils frames and load time
+with and without compact_ids on a synthetic feed.
+
+    python benchmarks/bench_compact_ids.py --routes 400 --trips 200
+"""
+
+import argparse
+import tempfile
+import time
+
+from synthetic_feed import SERVICE_DATE, write_feed
+
+from transit_service_analyst import load_gtfs
+
+FRAMES = [
+    "trips",
+    "stop_times",
+    "stops",
+    "_df_all_stops_by_trips",
+    "schedule_pattern_df",
+]
+
+
+def measure(gtfs_dir, compact_ids):
+    start = time.perf_counter()
+    service = load_gtfs(gtfs_dir, SERVICE_DATE, compact_ids=compact_ids)
+    service.warm()
+    elapsed = time.perf_counter() - start
+    sizes = {
+        name: getattr(service, name).memory_usage(deep=True).sum() / 2**20
+        for name in FRAMES
+    }
+    start = time.perf_counter()
+    service.get_tph_by_line()
+    service.get_tph_at_stops()
+    service.get_service_hours_by_line()
+    analysis = time.perf_counter() - start
+    return elapsed, analysis, sizes
+
+
+def run(routes, trips):
+    with tempfile.TemporaryDirectory() as gtfs_dir:
+        write_feed(gtfs_dir, routes=routes, trips_per_route=trips)
+        print(f"{routes * trips * 30:,} stop_times rows")
+        results = {flag: measure(gtfs_dir, flag) for flag in [False, True]}
+        print(f"{'':<24}{'strings':>10}{'compact':>10}")
+        for name in FRAMES:
+            before, after = (results[flag][2][name] for flag in [False, True])
+            print(f"{name + ' MB':<24}{before:>10.1f}{after:>10.1f}")
+        for i, label in enumerate(["load_gtfs s", "get_* s"]):
+            before, after = (results[flag][i] for flag in [False, True])
+            print(f"{label:<24}{before:>10.2f}{after:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=400)
+    parser.add_argument("--trips", type=int, default=200)
+    args = parser.parse_args()
+    run(args.routes, args.trips)
@@ -0,0 +1,60 @@
+"""
+Compares wall-clock ingest time of the CSV engines accepted by GTFS_Feed
+and load_gtfs on a synthetic feed. Engines whose package is not installed
+are skipped.
+
+    python benchmarks/bench_engines.py --routes 400 --trips 200
+"""
+
+import argparse
+import importlib.util
+import tempfile
+import time
+
+from synthetic_feed import SERVICE_DATE, write_feed
+
+from transit_service_analyst import GTFS_Feed, load_gtfs
+
+# package each engine needs, if any:
+ENGINE_PACKAGES = {"c": None, "pyarrow": "pyarrow", "polars": "polars"}
+
+
+def time_call(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(routes, trips, stops_per_trip):
+    with tempfile.TemporaryDirectory() as gtfs_dir:
+        write_feed(
+            gtfs_dir,
+            routes=routes,
+            trips_per_route=trips,
+            stops_per_trip=stops_per_trip,
+        )
+        print(f"{routes * trips * stops_per_trip:,} stop_times rows")
+        print(f"{'engine':<10}{'stop_times':>12}{'shapes':>10}{'load_gtfs':>12}")
+        for engine, package in ENGINE_PACKAGES.items():
+            if package and importlib.util.find_spec(package) is None:
+                print(f"{engine:<10}{'not installed':>34}")
+                continue
+            stop_times = time_call(
+                lambda: GTFS_Feed(gtfs_dir, engine=engine).get_table("stop_times")
+            )
+            shapes = time_call(
+                lambda: GTFS_Feed(gtfs_dir, engine=engine).get_table("shapes")
+            )
+            load = time_call(
+                lambda: load_gtfs(gtfs_dir, SERVICE_DATE, engine=engine).warm()
+            )
+            print(f"{engine:<10}{stop_times:>12.2f}{shapes:>10.2f}{load:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=400)
+    parser.add_argument("--trips", type=int, default=200)
+    parser.add_argument("--stops-per-trip", type=int, default=30)
+    args = parser.parse_args()
+    run(args.routes, args.trips, args.stops_per_trip)
@@ -0,0 +1,155 @@
+"""
+Compares the array-based frequencies.txt expansion in Service_Utils with
+the merge and index.repeat expansion it replaced, on a synthetic feed
+whose first routes are modeled with frequencies. Reports wall time and
+peak memory allocated by each.
+
+    python benchmarks/bench_frequencies.py --routes 100 --frequency-routes 50
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from synthetic_feed import SERVICE_DATE, write_feed
+
+from transit_service_analyst import GTFS_Feed
+from transit_service_analyst.gtfs_service import Service_Utils
+from transit_service_analyst.gtfs_time import hhmmss_to_seconds, seconds_to_hhmmss
+
+
+def repeat_expansion(trips, stop_times, frequencies):
+    """
+    Expansion used by Service_Utils.frequencies_to_trips before it
+    worked on arrays: every template row is repeated as a whole DataFrame
+    and numbered with grouped cumcounts.
+    """
+    # some feeds will use the same trip_id for multiple rows
+    # need to create a unique id for each row
+    frequencies = frequencies.assign(frequency_id=frequencies.index)
+    trips_update = trips.merge(frequencies, on="trip_id")
+    trips_update = trips_update.loc[
+        trips_update.index.repeat(trips_update["total_trips"])
+    ].reset_index(drop=True)
+    trips_update["counter"] = trips_update.groupby("trip_id").cumcount() + 1
+    trips_update["trip_id"] = (
+        trips_update["trip_id"].astype(str) + "_" + trips_update["counter"].astype(str)
+    )
+
+    stop_times_update = frequencies.merge(stop_times, on="trip_id", how="left")
+    stop_times_update["arrival_time_secs"] = hhmmss_to_seconds(
+        stop_times_update["arrival_time"]
+    )
+    stop_times_update["elapsed_time"] = stop_times_update.groupby(
+        ["trip_id", "start_time"]
+    )["arrival_time_secs"].transform("first")
+    stop_times_update["elapsed_time"] = (
+        stop_times_update["arrival_time_secs"] - stop_times_update["elapsed_time"]
+    )
+    stop_times_update["arrival_time_secs"] = (
+        stop_times_update["start_time_secs"] + stop_times_update["elapsed_time"]
+    )
+    stop_times_update["departure_time_secs"] = stop_times_update["arrival_time_secs"]
+    stop_times_update = stop_times_update.loc[
+        stop_times_update.index.repeat(stop_times_update["total_trips"])
+    ].reset_index(drop=True)
+    stop_times_update["counter"] = stop_times_update.groupby(
+        ["frequency_id", "stop_id"]
+    ).cumcount()
+    for col in ["departure_time_secs", "arrival_time_secs"]:
+        stop_times_update[col] = stop_times_update[col] + (
+            stop_times_update["counter"] * stop_times_update["headway_secs"]
+        )
+    stop_times_update["counter"] = (
+        stop_times_update.groupby(["trip_id", "stop_id"]).cumcount() + 1
+    )
+    stop_times_update["departure_time"] = seconds_to_hhmmss(
+        stop_times_update["departure_time_secs"]
+    )
+    stop_times_update["arrival_time"] = seconds_to_hhmmss(
+        stop_times_update["arrival_time_secs"]
+    )
+    stop_times_update["trip_id"] = (
+        stop_times_update["trip_id"].astype(str)
+        + "_"
+        + stop_times_update["counter"].astype(str)
+    )
+
+    stop_times = stop_times[~stop_times["trip_id"].isin(frequencies["trip_id"])]
+    trips = trips[~trips["trip_id"].isin(frequencies["trip_id"])]
+    return (
+        pd.concat([trips, trips_update[trips.columns]]),
+        pd.concat([stop_times, stop_times_update[stop_times.columns]]),
+    )
+
+
+def array_expansion(service, trips, stop_times, frequencies):
+    """
+    Expansion done by Service_Utils when it reads stop_times.
+    """
+    return (
+        service._Service_Utils__expand_frequency_trips(trips, frequencies),
+        service._Service_Utils__expand_frequency_stop_times(stop_times, frequencies),
+    )
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    trips, stop_times = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return elapsed, peak, len(trips), len(stop_times)
+
+
+def run(routes, trips, frequency_routes, headway_secs, hours):
+    with tempfile.TemporaryDirectory() as gtfs_dir:
+        write_feed(
+            gtfs_dir,
+            routes=routes,
+            trips_per_route=trips,
+            frequency_routes=frequency_routes,
+            headway_secs=headway_secs,
+            frequency_hours=hours,
+        )
+        service = Service_Utils(gtfs_dir, SERVICE_DATE, feed=GTFS_Feed(gtfs_dir))
+        raw_trips = service.feed.get_table("trips")
+        raw_stop_times = service.feed.get_table("stop_times")
+        frequencies = service._Service_Utils__get_frequencies(raw_trips)
+        print(
+            f"{len(frequencies):,} frequencies rows, "
+            f"{frequencies['total_trips'].sum():,} trips run by them"
+        )
+        print(f"{'':<10}{'seconds':>10}{'peak MB':>10}{'trips':>10}{'stop_times':>12}")
+        for name, func in [
+            (
+                "repeat",
+                lambda: repeat_expansion(raw_trips, raw_stop_times, frequencies),
+            ),
+            (
+                "arrays",
+                lambda: array_expansion(
+                    service, raw_trips, raw_stop_times, frequencies
+                ),
+            ),
+        ]:
+            elapsed, peak, n_trips, n_stop_times = measure(func)
+            print(
+                f"{name:<10}{elapsed:>10.2f}{peak:>10.0f}{n_trips:>10,}"
+                f"{n_stop_times:>12,}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--trips", type=int, default=20)
+    parser.add_argument("--frequency-routes", type=int, default=50)
+    parser.add_argument("--headway-secs", type=int, default=300)
+    parser.add_argument("--hours", type=int, default=2)
+    args = parser.parse_args()
+    run(args.routes, args.trips, args.frequency_routes, args.headway_secs, args.hours)
@@ -0,0 +1,74 @@
+"""
+Compares peak RSS of load_gtfs when stop_times.txt is read whole and when
+it is streamed in chunks keeping only the trips for the service_date. The
+synthetic feed spreads trips over several service_ids so that most of
+stop_times.txt belongs to other service days.
+
+    python benchmarks/bench_stop_times_memory.py --routes 200 --service-ids 7
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic_feed import SERVICE_DATE
+
+
+def child(gtfs_dir, chunk_size):
+    """
+    Loads the feed and prints wall time and peak RSS in MB, run in a fresh
+    process so each measurement starts from the same baseline.
+    """
+    from transit_service_analyst import load_gtfs
+
+    start = time.perf_counter()
+    if gtfs_dir != "-":
+        load_gtfs(gtfs_dir, SERVICE_DATE, chunk_size=chunk_size).warm()
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed} {peak}")
+
+
+def measure(gtfs_dir, chunk_size=None):
+    args = [sys.executable, __file__, "--child", gtfs_dir, str(chunk_size or 0)]
+    out = subprocess.run(args, check=True, capture_output=True, text=True)
+    elapsed, peak = out.stdout.split()
+    return float(elapsed), float(peak)
+
+
+def run(routes, trips, service_ids, chunk_sizes):
+    with tempfile.TemporaryDirectory() as gtfs_dir:
+        # written by a separate process, a forked child would otherwise
+        # report this process's peak RSS:
+        args = [sys.executable, Path(__file__).with_name("synthetic_feed.py")]
+        args += [gtfs_dir, "--routes", str(routes), "--trips", str(trips)]
+        args += ["--service-ids", str(service_ids)]
+        subprocess.run(args, check=True)
+        _, baseline = measure("-")
+        print(f"{routes * trips * 30:,} stop_times rows, {service_ids} service_ids")
+        print(f"{'chunk_size':<12}{'seconds':>10}{'peak MB':>10}{'above imports':>15}")
+        for chunk_size in [None] + chunk_sizes:
+            elapsed, peak = measure(gtfs_dir, chunk_size)
+            print(
+                f"{str(chunk_size):<12}{elapsed:>10.2f}{peak:>10.0f}"
+                f"{peak - baseline:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], int(sys.argv[3]) or None)
+        sys.exit()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=100)
+    parser.add_argument("--service-ids", type=int, default=7)
+    parser.add_argument(
+        "--chunk-sizes", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+    run(args.routes, args.trips, args.service_ids, args.chunk_sizes)
@@ -0,0 +1,160 @@
+"""
+Times each stage of building a Service_Utils with load_gtfs and each
+get_* method on synthetic feeds of increasing size, and reports the peak
+memory allocated by each. Every stage is timed in one pass and its
+memory measured with tracemalloc in a second pass on a fresh instance,
+so tracing does not inflate the times. Pass --csv to keep the results
+for comparing runs.
+
+    python benchmarks/bench_suite.py --routes 50 200 800 --csv suite.csv
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from synthetic_feed import SERVICE_DATE, write_feed
+
+from transit_service_analyst import load_gtfs
+from transit_service_analyst.gtfs_service import Service_Utils
+
+# get_* methods and the arguments they are timed with, given the
+# instance:
+METHODS = [
+    ("get_tph_by_line", lambda service: ()),
+    ("get_tph_at_stops", lambda service: ()),
+    ("get_headways_at_stops", lambda service: ()),
+    ("get_total_trips_by_line", lambda service: ()),
+    ("get_line_time", lambda service: ()),
+    ("get_service_hours_by_line", lambda service: ()),
+    ("get_service_distance_by_line", lambda service: ()),
+    ("get_service_distance_by_hour", lambda service: ()),
+    ("get_routes_by_stops", lambda service: ()),
+    ("get_lines_gdf", lambda service: ()),
+    ("get_line_stops_gdf", lambda service: ()),
+    ("get_stops_near", lambda service: (service.stops.geometry, 400)),
+    ("get_routes_near", lambda service: (service.stops.geometry, 400)),
+    ("get_raptor", lambda service: ()),
+]
+
+# only used by update:
+SKIPPED = ["_trip_hashes"]
+
+
+def build_order():
+    """
+    Returns the derived attributes of Service_Utils ordered so that each
+    one comes after the attributes it is built from, so every stage is
+    timed on its own.
+    """
+    order = []
+
+    def visit(name):
+        if name in order or name not in Service_Utils._dependencies:
+            return
+        for depends_on in Service_Utils._dependencies[name]:
+            visit(depends_on)
+        order.append(name)
+
+    for name in Service_Utils._dependencies:
+        if name not in SKIPPED:
+            visit(name)
+    return order
+
+
+def stages(gtfs_dir):
+    """
+    Yields the name of each stage and a function that runs it. The first
+    stage creates the instance, the others use it.
+    """
+    service = None
+
+    def load():
+        nonlocal service
+        service = load_gtfs(gtfs_dir, SERVICE_DATE)
+
+    yield "load_gtfs", load
+    for name in build_order():
+        yield name, lambda name=name: getattr(service, name)
+    for name, args in METHODS:
+        yield name, lambda name=name, args=args: getattr(service, name)(*args(service))
+
+
+def run_stages(gtfs_dir, trace):
+    """
+    Returns a dictionary of the seconds taken by each stage, or of the
+    peak MB it allocated if trace.
+    """
+    results = {}
+    if trace:
+        tracemalloc.start()
+    for name, stage in stages(gtfs_dir):
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            stage()
+            results[name] = (tracemalloc.get_traced_memory()[1] - before) / 2**20
+        else:
+            start = time.perf_counter()
+            stage()
+            results[name] = time.perf_counter() - start
+    if trace:
+        tracemalloc.stop()
+    return results
+
+
+def run(sizes, feed_kwargs, csv):
+    rows = []
+    for routes in sizes:
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            write_feed(gtfs_dir, routes=routes, **feed_kwargs)
+            n_rows = sum(1 for _ in open(Path(gtfs_dir) / "stop_times.txt")) - 1
+            seconds = run_stages(gtfs_dir, trace=False)
+            peak = run_stages(gtfs_dir, trace=True)
+        print(f"\n{routes} routes, {n_rows:,} stop_times rows")
+        print(f"{'stage':<28}{'seconds':>10}{'peak MB':>10}")
+        for name in seconds:
+            print(f"{name:<28}{seconds[name]:>10.3f}{peak[name]:>10.1f}")
+            rows.append(
+                {
+                    "routes": routes,
+                    "stop_times_rows": n_rows,
+                    "stage": name,
+                    "seconds": seconds[name],
+                    "peak_mb": peak[name],
+                }
+            )
+        total = sum(seconds.values())
+        print(f"{'total':<28}{total:>10.3f}")
+    if csv:
+        pd.DataFrame(rows).to_csv(csv, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--trips", type=int, default=40)
+    parser.add_argument("--stops-per-trip", type=int, default=30)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--patterns", type=int, default=2)
+    parser.add_argument("--shape-vertices", type=int, default=200)
+    parser.add_argument("--service-ids", type=int, default=3)
+    parser.add_argument("--exception-dates", type=int, default=20)
+    parser.add_argument("--frequency-routes", type=int, default=0)
+    parser.add_argument("--csv", default=None)
+    args = parser.parse_args()
+    feed_kwargs = {
+        "trips_per_route": args.trips,
+        "stops_per_trip": args.stops_per_trip,
+        "stops": args.stops,
+        "patterns_per_route": args.patterns,
+        "shape_vertices": args.shape_vertices,
+        "service_ids": args.service_ids,
+        "exception_dates": args.exception_dates,
+        "frequency_routes": args.frequency_routes,
+    }
+    run(args.routes, feed_kwargs, args.csv)
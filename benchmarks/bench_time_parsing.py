@@ -0,0 +1,66 @@
+"""
+Compares the vectorized HH:MM:SS codec in gtfs_time against the row-wise
+DataFrame.apply path previously used by Service_Utils.
+
+    python benchmarks/bench_time_parsing.py --rows 1000000
+"""
+
+import argparse
+import time as _time
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from transit_service_analyst.gtfs_time import hhmmss_to_seconds, seconds_to_hhmmss
+
+
+def convert_to_seconds(row, field):
+    """
+    Row-wise parser, as used with DataFrame.apply before gtfs_time.
+    """
+    h, m, s = row[field].split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def to_hhmmss(row, field):
+    """
+    Row-wise formatter, as used with DataFrame.apply before gtfs_time.
+    """
+    return _time.strftime("%H:%M:%S", _time.gmtime(row[field]))
+
+
+def make_times(rows, seed=0):
+    """
+    Returns a DataFrame of random departure times between 00:00:00 and
+    29:59:59, in seconds and as HH:MM:SS strings.
+    """
+    rng = np.random.default_rng(seed)
+    secs = rng.integers(0, 30 * 3600, rows)
+    df = pd.DataFrame({"secs": secs})
+    df["departure_time"] = seconds_to_hhmmss(secs)
+    return df
+
+
+def run(rows, repeat):
+    df = make_times(rows)
+    results = {
+        "parse apply": lambda: df.apply(
+            convert_to_seconds, axis=1, args=("departure_time",)
+        ),
+        "parse vectorized": lambda: hhmmss_to_seconds(df["departure_time"]),
+        "format apply": lambda: df.apply(to_hhmmss, axis=1, args=("secs",)),
+        "format vectorized": lambda: seconds_to_hhmmss(df["secs"]),
+    }
+    print(f"{rows:,} rows, best of {repeat}")
+    for name, func in results.items():
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print(f"{name:<20}{best:>10.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
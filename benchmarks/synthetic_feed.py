@@ -0,0 +1,204 @@
+"""
+Writes synthetic GTFS feeds for the benchmarks.
+
+    python benchmarks/synthetic_feed.py out_dir --routes 200 --trips 100
+    python benchmarks/synthetic_feed.py out_dir --patterns 4 --shape-vertices 300
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from transit_service_analyst.gtfs_calendar import week_days
+from transit_service_analyst.gtfs_time import seconds_to_hhmmss
+
+SERVICE_DATE = "20240610"
+
+
+def write_feed(
+    out_dir,
+    routes=50,
+    trips_per_route=40,
+    stops_per_trip=30,
+    stops=2000,
+    service_ids=1,
+    frequency_routes=0,
+    headway_secs=300,
+    frequency_hours=2,
+    patterns_per_route=1,
+    shape_vertices=None,
+    exception_dates=0,
+    seed=0,
+):
+    """
+    Writes a GTFS feed to out_dir with routes x trips_per_route trips of
+    stops_per_trip stops each. Trips are spread evenly over service_ids
+    weekday calendars, only the first of which runs on SERVICE_DATE.
+    The trips of the first frequency_routes routes are templates in
+    frequencies.txt, each run every headway_secs for frequency_hours
+    from its start. Returns out_dir.
+
+    Each route has patterns_per_route stop patterns, all but the first
+    detouring to other stops for a tenth of the route, and a shape for
+    each pattern with shape_vertices points (by default one at each
+    stop). exception_dates adds that many calendar_dates.txt records to
+    each service_id, alternately adding and removing service on dates
+    other than SERVICE_DATE.
+    """
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    stop_ids = np.array([f"stop_{i}" for i in range(stops)], dtype=object)
+    pd.DataFrame(
+        {
+            "stop_id": stop_ids,
+            "stop_name": stop_ids,
+            "stop_lat": 47.4 + rng.random(stops) * 0.4,
+            "stop_lon": -122.4 + rng.random(stops) * 0.4,
+        }
+    ).to_csv(out_dir / "stops.txt", index=False)
+
+    calendar = pd.DataFrame(
+        {"service_id": [f"service_{i}" for i in range(service_ids)]}
+    )
+    for i, day in enumerate(week_days):
+        calendar[day] = int(i < 5)
+    # only service_0 is in effect on SERVICE_DATE, the others are earlier
+    # schedule periods:
+    years = 2024 - np.arange(service_ids)
+    calendar["start_date"] = years * 10000 + 101
+    calendar["end_date"] = years * 10000 + 1231
+    calendar.to_csv(out_dir / "calendar.txt", index=False)
+
+    route_ids = np.array([f"route_{i}" for i in range(routes)], dtype=object)
+    pd.DataFrame(
+        {"route_id": route_ids, "route_short_name": route_ids, "route_type": 3}
+    ).to_csv(out_dir / "routes.txt", index=False)
+
+    n_trips = routes * trips_per_route
+    trip_route = np.repeat(np.arange(routes), trips_per_route)
+    # consecutive trips of a route share a pattern, so patterns are not
+    # tied to the service_ids, which alternate between trips:
+    trip_pattern = trip_route * patterns_per_route + (
+        np.arange(n_trips) % trips_per_route * patterns_per_route // trips_per_route
+    )
+    trip_ids = np.array([f"trip_{i}" for i in range(n_trips)], dtype=object)
+    pd.DataFrame(
+        {
+            "route_id": route_ids[trip_route],
+            "service_id": calendar["service_id"].to_numpy()[
+                np.arange(n_trips) % service_ids
+            ],
+            "trip_id": trip_ids,
+            "direction_id": np.arange(n_trips) % 2,
+            "shape_id": [f"shape_{i}" for i in trip_pattern],
+            "block_id": "",
+        }
+    ).to_csv(out_dir / "trips.txt", index=False)
+
+    # every route serves a fixed random sequence of stops:
+    route_stops = rng.integers(0, stops, (routes, stops_per_trip))
+    start = rng.integers(5 * 3600, 25 * 3600, n_trips)
+    pattern_stops = np.repeat(route_stops, patterns_per_route, axis=0)
+    detours = np.flatnonzero(np.arange(len(pattern_stops)) % patterns_per_route > 0)
+    positions = rng.integers(0, stops_per_trip, (len(detours), stops_per_trip // 10))
+    pattern_stops[detours[:, None], positions] = rng.integers(0, stops, positions.shape)
+    offsets = np.arange(stops_per_trip) * 90
+    times = seconds_to_hhmmss((start[:, None] + offsets).ravel())
+    pd.DataFrame(
+        {
+            "trip_id": np.repeat(trip_ids, stops_per_trip),
+            "arrival_time": times,
+            "departure_time": times,
+            "stop_id": stop_ids[pattern_stops[trip_pattern].ravel()],
+            "stop_sequence": np.tile(np.arange(1, stops_per_trip + 1), n_trips),
+            "stop_headsign": "",
+            "shape_dist_traveled": np.tile(offsets * 10.0, n_trips),
+        }
+    ).to_csv(out_dir / "stop_times.txt", index=False)
+
+    stop_lat_lon = pd.read_csv(out_dir / "stops.txt")[["stop_lat", "stop_lon"]]
+    points = stop_lat_lon.to_numpy()[pattern_stops]
+    n_shapes = len(pattern_stops)
+    shape_vertices = shape_vertices or stops_per_trip
+    if shape_vertices != stops_per_trip:
+        # vertices spaced evenly along the lines between the stops:
+        along = np.linspace(0, stops_per_trip - 1, shape_vertices)
+        before = np.minimum(along.astype(int), stops_per_trip - 2)
+        fraction = (along - before)[None, :, None]
+        points = points[:, before] + fraction * (
+            points[:, before + 1] - points[:, before]
+        )
+    points = points.reshape(-1, 2)
+    pd.DataFrame(
+        {
+            "shape_id": np.repeat(
+                [f"shape_{i}" for i in range(n_shapes)], shape_vertices
+            ),
+            "shape_pt_lat": points[:, 0],
+            "shape_pt_lon": points[:, 1],
+            "shape_pt_sequence": np.tile(np.arange(1, shape_vertices + 1), n_shapes),
+        }
+    ).to_csv(out_dir / "shapes.txt", index=False)
+
+    if exception_dates:
+        first_days = np.array([f"{year}-01-01" for year in years], "datetime64[D]")
+        days = first_days[:, None] + rng.integers(
+            0, 365, (service_ids, exception_dates)
+        )
+        dates = pd.to_datetime(days.ravel()).strftime("%Y%m%d").astype(int)
+        calendar_dates = pd.DataFrame(
+            {
+                "service_id": np.repeat(calendar["service_id"], exception_dates),
+                "date": dates,
+                "exception_type": np.arange(len(dates)) % 2 + 1,
+            }
+        )
+        calendar_dates = calendar_dates[calendar_dates["date"] != int(SERVICE_DATE)]
+        calendar_dates = calendar_dates.drop_duplicates(["service_id", "date"])
+        calendar_dates.to_csv(out_dir / "calendar_dates.txt", index=False)
+
+    frequency_trips = trip_route < frequency_routes
+    if frequency_trips.any():
+        start = start[frequency_trips]
+        pd.DataFrame(
+            {
+                "trip_id": trip_ids[frequency_trips],
+                "start_time": seconds_to_hhmmss(start),
+                "end_time": seconds_to_hhmmss(start + frequency_hours * 3600),
+                "headway_secs": headway_secs,
+            }
+        ).to_csv(out_dir / "frequencies.txt", index=False)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out_dir")
+    parser.add_argument("--routes", type=int, default=50)
+    parser.add_argument("--trips", type=int, default=40)
+    parser.add_argument("--stops-per-trip", type=int, default=30)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--service-ids", type=int, default=1)
+    parser.add_argument("--frequency-routes", type=int, default=0)
+    parser.add_argument("--patterns", type=int, default=1)
+    parser.add_argument("--shape-vertices", type=int, default=None)
+    parser.add_argument("--exception-dates", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_feed(
+        args.out_dir,
+        routes=args.routes,
+        trips_per_route=args.trips,
+        stops_per_trip=args.stops_per_trip,
+        stops=args.stops,
+        service_ids=args.service_ids,
+        frequency_routes=args.frequency_routes,
+        patterns_per_route=args.patterns,
+        shape_vertices=args.shape_vertices,
+        exception_dates=args.exception_dates,
+        seed=args.seed,
+    )
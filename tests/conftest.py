@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the synthetic feeds are written by the benchmarks' generator:
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from synthetic_feed import SERVICE_DATE, write_feed  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def service_date():
+    return SERVICE_DATE
+
+
+@pytest.fixture(scope="session")
+def gtfs_dir(tmp_path_factory):
+    """
+    Small synthetic feed with two stop patterns per route, shapes and
+    calendar exceptions. Routes share stops, so journeys transfer.
+    """
+    return write_feed(
+        tmp_path_factory.mktemp("gtfs"),
+        routes=10,
+        trips_per_route=12,
+        stops_per_trip=10,
+        stops=60,
+        service_ids=2,
+        patterns_per_route=2,
+        shape_vertices=20,
+        exception_dates=4,
+    )
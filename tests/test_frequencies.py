@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from bench_frequencies import array_expansion, repeat_expansion
+from synthetic_feed import write_feed
+
+from transit_service_analyst import GTFS_Feed
+from transit_service_analyst.gtfs_service import Service_Utils
+from transit_service_analyst.gtfs_time import hhmmss_to_seconds
+
+
+@pytest.fixture(scope="module")
+def frequency_gtfs_dir(tmp_path_factory):
+    """
+    Synthetic feed whose first routes run as frequencies.txt templates.
+    """
+    return write_feed(
+        tmp_path_factory.mktemp("gtfs_frequencies"),
+        routes=8,
+        trips_per_route=6,
+        stops_per_trip=8,
+        stops=1000,
+        frequency_routes=5,
+        headway_secs=600,
+        frequency_hours=2,
+    )
+
+
+def test_expansion_matches_repeat(frequency_gtfs_dir, service_date):
+    service = Service_Utils(
+        frequency_gtfs_dir, service_date, feed=GTFS_Feed(frequency_gtfs_dir)
+    )
+    trips = service.feed.get_table("trips")
+    stop_times = service.feed.get_table("stop_times")
+    frequencies = service._Service_Utils__get_frequencies(trips)
+
+    # the repeat expansion numbers trips by their visits to each stop and
+    # so needs templates that visit every stop once and finish within 24h:
+    template_times = stop_times.assign(
+        secs=hhmmss_to_seconds(stop_times["arrival_time"])
+    ).groupby("trip_id")
+    duration = template_times["secs"].max() - template_times["secs"].min()
+    distinct = template_times["stop_id"].nunique() == template_times.size()
+    frequencies = frequencies[
+        frequencies["trip_id"].map(distinct)
+        & (
+            frequencies["end_time_secs"] + frequencies["trip_id"].map(duration)
+            < 24 * 3600
+        )
+    ]
+    assert len(frequencies) > 10
+
+    expected = repeat_expansion(trips, stop_times, frequencies)
+    result = array_expansion(service, trips, stop_times, frequencies)
+    for keys, left, right in zip(
+        [["trip_id"], ["trip_id", "stop_sequence"]], result, expected
+    ):
+        pd.testing.assert_frame_equal(
+            left.sort_values(keys).reset_index(drop=True),
+            right.sort_values(keys).reset_index(drop=True),
+        )
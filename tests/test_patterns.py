@@ -0,0 +1,107 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from transit_service_analyst import GTFS_Feed
+from transit_service_analyst.gtfs_feed import _decode_ids
+from transit_service_analyst.gtfs_service import Service_Utils
+
+
+def list_scan_patterns(stops_by_trips, route_field="route_id"):
+    """
+    _schedule_pattern_dict as built before trips were grouped on hashed
+    stop sequences: each trip's stops are compared with every pattern
+    already found on its route.
+    """
+    stop_sequence_dict = {
+        k: list(v)
+        for k, v in stops_by_trips.groupby(["trip_id", route_field])["stop_id"]
+    }
+    my_dict = {}
+    for (trip_id, route_id), value in stop_sequence_dict.items():
+        if route_id not in my_dict:
+            my_dict[route_id] = {trip_id: {"stops": value, "trip_ids": [trip_id]}}
+            continue
+        for data in my_dict[route_id].values():
+            if value == data["stops"]:
+                data["trip_ids"].append(trip_id)
+                break
+        else:
+            my_dict[route_id][trip_id] = {"stops": value, "trip_ids": [trip_id]}
+    return my_dict
+
+
+def list_scan_pattern_df(patterns, stops_by_trips):
+    """
+    schedule_pattern_df as built from list_scan_patterns.
+    """
+    rows = [
+        {"route_id": route_id, "trip_id1": trip_id, "trip_id2": trip}
+        for route_id, trips in patterns.items()
+        for trip_id, data in trips.items()
+        for trip in data["trip_ids"]
+    ]
+    df = stops_by_trips.drop_duplicates(["trip_id"])
+    df2 = pd.DataFrame(rows).merge(
+        df[["trip_id", "shape_id"]], how="right", left_on="trip_id2", right_on="trip_id"
+    )
+    df2 = df2.rename(columns={"trip_id1": "rep_trip_id", "trip_id": "orig_trip_id"})
+    return df2.drop(columns=["trip_id2"])
+
+
+@pytest.fixture(scope="module")
+def loop_gtfs_dir(gtfs_dir, tmp_path_factory):
+    """
+    Copy of gtfs_dir where the trips of one pattern of route_0 end at the
+    stop they start from, and every other one also visits it on the way.
+    """
+    new_dir = tmp_path_factory.mktemp("gtfs_loops")
+    shutil.copytree(gtfs_dir, new_dir, dirs_exist_ok=True)
+    trips = pd.read_csv(new_dir / "trips.txt", dtype=str)
+    stop_times = pd.read_csv(new_dir / "stop_times.txt", dtype=str)
+    stop_times["stop_sequence"] = stop_times["stop_sequence"].astype(int)
+
+    # service_0 is the calendar that runs on service_date:
+    loop_trips = trips.loc[
+        (trips["route_id"] == "route_0") & (trips["service_id"] == "service_0")
+    ]
+    loop_trips = loop_trips.loc[
+        loop_trips["shape_id"] == loop_trips["shape_id"].iloc[0], "trip_id"
+    ]
+    for i, trip_id in enumerate(loop_trips):
+        rows = stop_times.index[stop_times["trip_id"] == trip_id]
+        first_stop = stop_times.loc[rows[0], "stop_id"]
+        stop_times.loc[rows[-1], "stop_id"] = first_stop
+        if i % 2:
+            stop_times.loc[rows[len(rows) // 2], "stop_id"] = first_stop
+    stop_times.to_csv(new_dir / "stop_times.txt", index=False)
+    return new_dir
+
+
+@pytest.mark.parametrize("compact_ids", [False, True])
+def test_patterns_match_list_scan(loop_gtfs_dir, service_date, compact_ids):
+    feed = GTFS_Feed(loop_gtfs_dir, compact_ids=compact_ids)
+    service = Service_Utils(loop_gtfs_dir, service_date, feed=feed)
+    stops_by_trips = _decode_ids(
+        service._df_all_stops_by_trips.drop(columns="rep_trip_id")
+    )
+
+    expected = list_scan_patterns(stops_by_trips)
+    patterns = service._schedule_pattern_dict
+    assert [(route, list(trips.items())) for route, trips in patterns.items()] == [
+        (route, list(trips.items())) for route, trips in expected.items()
+    ]
+    # two patterns of route_0 start and end at the same stop:
+    loops = [
+        data["stops"]
+        for data in patterns["route_0"].values()
+        if data["stops"][0] == data["stops"][-1]
+    ]
+    assert len(loops) == 2
+    assert any(len(set(route)) < len(route) - 1 for route in loops)
+
+    pd.testing.assert_frame_equal(
+        _decode_ids(service.schedule_pattern_df),
+        list_scan_pattern_df(expected, stops_by_trips),
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from transit_service_analyst import load_gtfs
+
+
+def brute_force_arrival(stop_events, transfers, n_stops, origin, departure, rounds):
+    """
+    Earliest arrival at each stop found by scanning every trip in every
+    round, the rules Raptor follows: a trip is boarded at a stop reached
+    in an earlier round at or before it departs, and each round walks one
+    transfer from the stops it improved.
+    """
+    best = np.full(n_stops, np.inf)
+    best[origin] = departure
+    for from_stop, to_stop, minutes in transfers:
+        if from_stop == origin:
+            best[to_stop] = min(best[to_stop], departure + minutes)
+    for _ in range(rounds):
+        previous = best.copy()
+        for stops, times in stop_events:
+            boarded = False
+            for stop, time in zip(stops, times):
+                if boarded:
+                    best[stop] = min(best[stop], time)
+                elif previous[stop] <= time:
+                    boarded = True
+        improved = best < previous
+        if not improved.any():
+            break
+        walked = best.copy()
+        for from_stop, to_stop, minutes in transfers:
+            if improved[from_stop]:
+                walked[to_stop] = min(walked[to_stop], best[from_stop] + minutes)
+        best = walked
+    return best
+
+
+@pytest.fixture(scope="module")
+def service(gtfs_dir, service_date):
+    return load_gtfs(gtfs_dir, service_date)
+
+
+def test_earliest_arrival_matches_trip_scan(service):
+    router = service.get_raptor(max_walk_distance=2000)
+    timetable = service.timetable
+
+    df = service._df_all_stops_by_trips.sort_values(["trip_id", "stop_sequence"])
+    df = df.assign(stop=timetable.stop_index(df["stop_id"]))
+    stop_events = [
+        (trip["stop"].to_numpy(), trip["departure_time_mins"].to_numpy())
+        for _, trip in df.groupby("trip_id")
+    ]
+    from_stops = np.repeat(np.arange(router.n_stops), np.diff(router.transfer_offsets))
+    transfers = list(zip(from_stops, router.transfer_to, router.transfer_minutes))
+    assert transfers
+
+    rng = np.random.default_rng(0)
+    origins = rng.choice(timetable.stop_ids, 8, replace=False)
+    for origin in origins:
+        # the last includes boarding a trip that leaves as the journey
+        # starts:
+        at_origin = np.sort(df.loc[df["stop_id"] == origin, "departure_time_mins"])
+        for departure in [360, 480, at_origin[len(at_origin) // 2]]:
+            for rounds in [1, 3]:
+                expected = brute_force_arrival(
+                    stop_events,
+                    transfers,
+                    router.n_stops,
+                    timetable.stop_index([origin])[0],
+                    departure,
+                    rounds,
+                )
+                np.testing.assert_array_equal(
+                    router.earliest_arrival(origin, departure, rounds), expected
+                )
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transit_service_analyst.gtfs_time import hhmmss_to_seconds, seconds_to_hhmmss
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        ("00:00:00", 0),
+        ("08:15:00", 29700),
+        ("23:59:59", 86399),
+        # trips past midnight:
+        ("24:00:00", 86400),
+        ("25:10:05", 90605),
+        ("100:00:01", 360001),
+        ("123:45:06", 445506),
+        # single digit hours:
+        ("8:05:09", 29109),
+        ("0:00:01", 1),
+        # whitespace:
+        (" 08:00:00", 28800),
+        ("   7:00:00", 25200),
+        ("\t100:00:00 ", 360000),
+    ],
+)
+def test_hhmmss_to_seconds(value, seconds):
+    assert hhmmss_to_seconds([value])[0] == seconds
+
+
+@pytest.mark.parametrize(
+    "value", [None, np.nan, "", "ab:cd:ef", "12:30", "12:3x:00", "08-15-00"]
+)
+def test_hhmmss_to_seconds_missing_or_malformed(value):
+    assert np.isnan(hhmmss_to_seconds(["08:00:00", value])[1])
+
+
+def test_hhmmss_to_seconds_series():
+    times = pd.Series(["08:00:00", None, "25:00:00", "7:30:00"], index=[5, 6, 7, 8])
+    np.testing.assert_array_equal(
+        hhmmss_to_seconds(times), [28800, np.nan, 90000, 27000]
+    )
+    assert len(hhmmss_to_seconds(pd.Series([], dtype=object))) == 0
+
+
+def test_seconds_to_hhmmss():
+    formatted = seconds_to_hhmmss([0, 29700, 86400, 90605, 360001, 59.6, np.nan, None])
+    assert formatted.tolist() == [
+        "00:00:00",
+        "08:15:00",
+        "24:00:00",
+        "25:10:05",
+        "100:00:01",
+        "00:01:00",
+        None,
+        None,
+    ]
+
+
+def test_round_trip():
+    seconds = np.concatenate([np.arange(0, 30 * 3600, 997), [99 * 3600, 123456, 0]])
+    formatted = seconds_to_hhmmss(seconds)
+    np.testing.assert_array_equal(hhmmss_to_seconds(formatted), seconds)
+    np.testing.assert_array_equal(
+        seconds_to_hhmmss(hhmmss_to_seconds(formatted)), formatted
+    )
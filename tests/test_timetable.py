@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transit_service_analyst.gtfs_timetable import Timetable
+
+STOPS_BY_TRIPS = pd.DataFrame(
+    {
+        "trip_id": ["trip_1", "trip_1", "trip_2", "trip_2"],
+        "rep_trip_id": ["trip_1"] * 4,
+        "stop_id": ["stop_a", "stop_b", "stop_a", "stop_b"],
+        "stop_sequence": [1, 2, 1, 2],
+        "departure_time_mins": [480.0, 490.0, 540.0, 550.0],
+    }
+)
+
+
+def test_next_departures():
+    timetable = Timetable.from_stops_by_trips(STOPS_BY_TRIPS)
+    df = timetable.next_departures(
+        ["stop_a", "stop_a", "stop_b", "stop_x"], [480, 481, 551, 0]
+    )
+    assert list(df["trip_id"]) == ["trip_1", "trip_2", None, None]
+    np.testing.assert_array_equal(
+        df["departure_time_mins"], [480.0, 540.0, np.nan, np.nan]
+    )
+
+
+@pytest.mark.parametrize(
+    "stops_by_trips",
+    [
+        STOPS_BY_TRIPS.iloc[:0],
+        STOPS_BY_TRIPS.assign(departure_time_mins=np.nan),
+    ],
+    ids=["no_rows", "no_times"],
+)
+def test_no_stop_events(stops_by_trips):
+    timetable = Timetable.from_stops_by_trips(stops_by_trips)
+    assert not len(timetable.stop_events)
+    events = timetable.next_departure_events(
+        timetable.stop_index(["stop_a", "stop_x"]), [480, 480]
+    )
+    np.testing.assert_array_equal(events, [-1, -1])
+    df = timetable.next_departures(["stop_a", "stop_x"], [480, 480])
+    assert df["trip_id"].isna().all()
+    assert df["departure_time_mins"].isna().all()
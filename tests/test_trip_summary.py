@@ -0,0 +1,15 @@
+import pandas as pd
+
+from transit_service_analyst import load_gtfs
+
+
+def test_trip_summary_does_not_depend_on_row_order(gtfs_dir, service_date):
+    service = load_gtfs(gtfs_dir, service_date)
+    stops_by_trips = service._df_all_stops_by_trips
+    summary = service.trip_summary
+    counts = stops_by_trips.groupby("trip_id").size()
+    assert (summary.set_index("trip_id")["stop_count"] == counts).all()
+
+    service.invalidate("_df_all_stops_by_trips")
+    service._df_all_stops_by_trips = stops_by_trips.sample(frac=1, random_state=0)
+    pd.testing.assert_frame_equal(service.trip_summary, summary)
@@ -0,0 +1,119 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from transit_service_analyst import Feed_Cache, GTFS_Feed
+from transit_service_analyst.gtfs_service import Service_Utils
+
+METHODS = [
+    "get_tph_by_line",
+    "get_tph_at_stops",
+    "get_total_trips_by_line",
+    "get_line_time",
+    "get_service_hours_by_line",
+    "get_routes_by_stops",
+    "get_lines_gdf",
+    "get_line_stops_gdf",
+]
+
+
+def read(gtfs_dir, name):
+    return pd.read_csv(gtfs_dir / f"{name}.txt", dtype=str, keep_default_na=False)
+
+
+@pytest.fixture(scope="module")
+def new_gtfs_dir(gtfs_dir, tmp_path_factory):
+    """
+    Copy of gtfs_dir with a trip retimed, removed and added, a stop
+    dropped from a trip, a route renamed, a shape moved and one removed
+    with its trips, and a stop moved.
+    """
+    new_dir = tmp_path_factory.mktemp("gtfs_v2")
+    shutil.copytree(gtfs_dir, new_dir, dirs_exist_ok=True)
+    trips = read(new_dir, "trips")
+    stop_times = read(new_dir, "stop_times")
+    routes = read(new_dir, "routes")
+    shapes = read(new_dir, "shapes")
+    stops = read(new_dir, "stops")
+
+    def first_trip(route_id):
+        return trips.loc[trips["route_id"] == route_id, "trip_id"].iloc[0]
+
+    retimed = stop_times.index[stop_times["trip_id"] == first_trip("route_1")][1]
+    stop_times.loc[retimed, ["arrival_time", "departure_time"]] = "23:59:00"
+    removed = first_trip("route_2")
+    trips = trips[trips["trip_id"] != removed]
+    stop_times = stop_times[stop_times["trip_id"] != removed]
+    added = first_trip("route_3")
+    trips = pd.concat([trips, trips[trips["trip_id"] == added].assign(trip_id="new")])
+    stop_times = pd.concat(
+        [stop_times, stop_times[stop_times["trip_id"] == added].assign(trip_id="new")]
+    )
+    shortened = first_trip("route_7")
+    stop_times = stop_times[
+        ~((stop_times["trip_id"] == shortened) & (stop_times["stop_sequence"] == "2"))
+    ]
+    routes.loc[routes["route_id"] == "route_6", "route_short_name"] = "six"
+    shapes.loc[shapes.index[shapes["shape_id"] == "shape_4"][0], "shape_pt_lat"] = 47.0
+    dropped = trips.loc[trips["shape_id"] == "shape_9", "trip_id"]
+    trips = trips[~trips["trip_id"].isin(dropped)]
+    stop_times = stop_times[~stop_times["trip_id"].isin(dropped)]
+    shapes = shapes[shapes["shape_id"] != "shape_9"]
+    moved = stop_times["stop_id"].iloc[0]
+    stops.loc[stops["stop_id"] == moved, "stop_lat"] = 47.0
+    for name, df in [
+        ("trips", trips),
+        ("stop_times", stop_times),
+        ("routes", routes),
+        ("shapes", shapes),
+        ("stops", stops),
+    ]:
+        df.to_csv(new_dir / f"{name}.txt", index=False)
+    return new_dir
+
+
+@pytest.mark.parametrize("compact_ids", [False, True])
+@pytest.mark.parametrize("mode", ["warm", "cache", "lazy"])
+def test_update_matches_full_build(
+    gtfs_dir, new_gtfs_dir, service_date, tmp_path, mode, compact_ids
+):
+    def build(gtfs_dir, cache=None):
+        feed = GTFS_Feed(gtfs_dir, compact_ids=compact_ids, keep_tables=False)
+        return Service_Utils(gtfs_dir, service_date, cache=cache, feed=feed)
+
+    if mode == "cache":
+        cache = Feed_Cache(tmp_path)
+        build(gtfs_dir, cache)
+        old = build(gtfs_dir, cache)
+    else:
+        old = build(gtfs_dir)
+        if mode == "warm":
+            old.warm()
+    new, changes = old.update(new_gtfs_dir)
+    full = build(new_gtfs_dir)
+    full.warm()
+
+    if mode != "lazy":
+        # spliced from old rather than built:
+        for name in ["_df_all_stops_by_trips", "schedule_pattern_df", "shapes"]:
+            pd.testing.assert_frame_equal(new.__dict__[name], full.__dict__[name])
+        assert list(new._schedule_pattern_dict.items()) == list(
+            full._schedule_pattern_dict.items()
+        )
+    for method in METHODS:
+        pd.testing.assert_frame_equal(getattr(new, method)(), getattr(full, method)())
+
+    changed = {
+        (table, change): set(group["id"])
+        for (table, change), group in changes.groupby(["table", "change"])
+    }
+    assert changed[("trips", "added")] == {"new"}
+    assert "shape_9" in changed[("shapes", "removed")]
+    assert changed[("shapes", "modified")] == {"shape_4"}
+    assert changed[("stops", "modified")] == {
+        read(gtfs_dir, "stop_times")["stop_id"][0]
+    }
+    assert {"route_1", "route_2", "route_3", "route_6", "route_7"} <= changed[
+        ("routes", "modified")
+    ]
@@ -1,5 +1,11 @@
 from .load_gtfs import load_gtfs
 from .gtfs_schema import GTFS_Schema
+from .gtfs_cache import Feed_Cache
+from .gtfs_feed import GTFS_Feed
+from .gtfs_region import Regional_Service, load_gtfs_feeds
+from .gtfs_timetable import Timetable
+from .gtfs_raptor import Raptor
+from .gtfs_profile import Stage_Profiler
 
 __all__ = [
     "route_representation",
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+# bump when the layout of a cache entry changes so old entries are ignored
+CACHE_VERSION = 2
+
+
+class Feed_Cache(object):
+    """
+    On-disk cache of the tables and derived DataFrames built by
+    Service_Utils. Each entry is a directory of Parquet files keyed on
+    the GTFS source files and the service_date, so changing any file in
+    the feed results in a new key. Entries are evicted least recently
+    used first when max_bytes or max_entries is exceeded. The cache also
+    records which GTFS files have passed validation, by a hash of their
+    contents, see GTFS_Feed.
+
+    Requires pyarrow.
+    """
+
+    def __init__(
+        self, cache_dir, max_bytes=None, max_entries=None, hash_contents=False
+    ):
+        """
+        cache_dir: directory to hold cache entries, created if missing.
+        max_bytes: upper bound on the total size of all entries.
+        max_entries: upper bound on the number of entries.
+        hash_contents: key on a hash of each file's contents rather than
+        its size and modification time.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hash_contents = hash_contents
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, gtfs_dir, service_date, compact_ids=False, validation="full"):
+        """
+        Returns the cache key for the GTFS files in gtfs_dir, or the GTFS
+        zip file at gtfs_dir, and service_date. compact_ids is part of
+        the key as it changes the dtypes of the stored ID columns, and
+        validation as an entry built from a feed validated less thoroughly
+        must not be returned to a feed that asks for more, see GTFS_Feed.
+        """
+        if not isinstance(gtfs_dir, (str, os.PathLike)):
+            raise TypeError("Feed_Cache requires gtfs_dir to be a path.")
+        gtfs_dir = Path(gtfs_dir)
+        paths = sorted(gtfs_dir.glob("*.txt")) if gtfs_dir.is_dir() else [gtfs_dir]
+
+        digest = hashlib.sha256(
+            f"{CACHE_VERSION}|{service_date}|{bool(compact_ids)}|{validation}".encode()
+        )
+        for path in paths:
+            digest.update(path.name.encode())
+            if self.hash_contents:
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+            else:
+                stat = path.stat()
+                digest.update(f"{stat.st_size}|{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns a tuple of (frames, meta) for key, or None if there is no
+        complete entry for it.
+        """
+        entry = self.cache_dir / key
+        meta_file = entry / "meta.json"
+        if not meta_file.is_file():
+            return None
+        with open(meta_file) as f:
+            meta = json.load(f)
+
+        frames = {}
+        for name, is_geo in meta["frames"].items():
+            path = entry / f"{name}.parquet"
+            frames[name] = gpd.read_parquet(path) if is_geo else pd.read_parquet(path)
+        # mark as recently used for eviction:
+        os.utime(meta_file)
+        return frames, meta["meta"]
+
+    def put(self, key, frames, meta):
+        """
+        Writes a dictionary of DataFrames and a json serializable
+        dictionary of metadata under key, then applies the eviction
+        policy.
+        """
+        entry = self.cache_dir / key
+        tmp = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        frame_types = {}
+        for name, df in frames.items():
+            is_geo = _has_geometry(df)
+            if not is_geo:
+                df = pd.DataFrame(df)
+            df.to_parquet(tmp / f"{name}.parquet")
+            frame_types[name] = is_geo
+        # meta.json is written last, an entry without it is incomplete:
+        with open(tmp / "meta.json", "w") as f:
+            json.dump({"frames": frame_types, "meta": meta}, f)
+
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def is_validated(self, digest, validation):
+        """
+        Returns True if a file with digest, see GTFS_Feed, has passed
+        validation at level validation, or full validation, before.
+        """
+        return any(
+            (self.cache_dir / "validated" / f"{digest}.{level}").is_file()
+            for level in {validation, "full"}
+        )
+
+    def set_validated(self, digest, validation):
+        """
+        Records that the file with digest has passed validation at level
+        validation, so it is not validated again.
+        """
+        validated = self.cache_dir / "validated"
+        validated.mkdir(exist_ok=True)
+        (validated / f"{digest}.{validation}").touch()
+
+    def entries(self):
+        """
+        Returns a DataFrame with the key, size in bytes and last access
+        time of each entry, least recently used first.
+        """
+        rows = []
+        for entry in self.cache_dir.iterdir():
+            meta_file = entry / "meta.json"
+            if entry.name.startswith(".") or not meta_file.is_file():
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            rows.append(
+                {
+                    "key": entry.name,
+                    "bytes": size,
+                    "last_used": meta_file.stat().st_mtime,
+                }
+            )
+        df = pd.DataFrame(rows, columns=["key", "bytes", "last_used"])
+        return df.sort_values("last_used").reset_index(drop=True)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache is within
+        max_bytes and max_entries.
+        """
+        df = self.entries()
+        total = df["bytes"].sum()
+        count = len(df)
+        for row in df.itertuples():
+            over_bytes = self.max_bytes is not None and total > self.max_bytes
+            over_entries = self.max_entries is not None and count > self.max_entries
+            if not (over_bytes or over_entries):
+                break
+            shutil.rmtree(self.cache_dir / row.key, ignore_errors=True)
+            total -= row.bytes
+            count -= 1
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        for entry in self.cache_dir.iterdir():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _has_geometry(df):
+    """
+    Returns True if df is a GeoDataFrame with an active geometry column.
+    """
+    if not isinstance(df, gpd.GeoDataFrame):
+        return False
+    try:
+        df.geometry
+    except AttributeError:
+        return False
+    return True
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+week_days = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+
+def get_active_service_ids(calendar, calendar_dates, service_dates):
+    """
+    Returns a DataFrame with a record for each service_id that runs on
+    each of service_dates (YYYYMMDD strings or integers), using the
+    regular service in calendar and the exceptions in calendar_dates.
+    Columns are date (YYYYMMDD integer) and service_id.
+    """
+    dates = pd.to_datetime(pd.Series(service_dates).astype(str), format="%Y%m%d")
+    int_dates = dates.dt.strftime("%Y%m%d").astype(int).to_numpy()
+    weekdays = dates.dt.weekday.to_numpy()
+
+    # calendar x date matrix of regular service:
+    start = calendar["start_date"].to_numpy()[:, None]
+    end = calendar["end_date"].to_numpy()[:, None]
+    runs_on_day = calendar[week_days].to_numpy()[:, weekdays] == 1
+    runs = runs_on_day & (start <= int_dates) & (end >= int_dates)
+    calendar_idx, date_idx = np.nonzero(runs)
+    regular = pd.DataFrame(
+        {
+            "date": int_dates[date_idx],
+            "service_id": calendar["service_id"].to_numpy()[calendar_idx],
+        }
+    )
+
+    exceptions = calendar_dates[calendar_dates["date"].isin(int_dates)]
+    added = exceptions.loc[exceptions["exception_type"] == 1, ["date", "service_id"]]
+    removed = exceptions.loc[exceptions["exception_type"] == 2, ["date", "service_id"]]
+
+    active = pd.concat([added, regular]).drop_duplicates()
+    active = active.merge(removed, how="left", indicator=True)
+    active = active.loc[active["_merge"] == "left_only", ["date", "service_id"]]
+    active["date"] = active["date"].astype(int)
+    return active.sort_values("date", kind="stable").reset_index(drop=True)
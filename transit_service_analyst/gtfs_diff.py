@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+
+def hash_by(df, key):
+    """
+    Returns a Series indexed by each value of column key with a hash of
+    the rows of df that have it. The hash changes when any of those rows
+    changes, is added or is removed. Rows are hashed by value, so ID
+    columns stored as Categoricals hash the same as strings. Include a
+    sequence column if the order of the rows matters.
+    """
+    categorical = [
+        col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    df = df.astype({col: object for col in categorical})
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    codes, uniques = pd.factorize(df[key])
+    keep = codes >= 0
+    hashes = np.zeros(len(uniques), dtype=np.uint64)
+    # the sum wraps around, which is fine for telling groups apart:
+    np.add.at(hashes, codes[keep], rows[keep])
+    return pd.Series(hashes, index=pd.Index(uniques, dtype=object, name=key))
+
+
+def diff_hashes(old, new, table):
+    """
+    Returns a DataFrame with the table, id and change ("added", "removed"
+    or "modified") of each key whose hash, as returned by hash_by,
+    differs between old and new.
+    """
+    common = old.index.intersection(new.index)
+    changes = [
+        ("added", new.index.difference(old.index)),
+        ("removed", old.index.difference(new.index)),
+        (
+            "modified",
+            common[old[common].to_numpy() != new[common].to_numpy()],
+        ),
+    ]
+    return pd.DataFrame(
+        {
+            "table": table,
+            "id": np.concatenate([np.asarray(ids, dtype=object) for _, ids in changes]),
+            "change": np.repeat(
+                [change for change, _ in changes], [len(ids) for _, ids in changes]
+            ),
+        }
+    )
@@ -0,0 +1,535 @@
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+from numpy import float64
+
+from .gtfs_cache import CACHE_VERSION
+from .gtfs_calendar import get_active_service_ids
+from .gtfs_profile import Stage_Profiler
+from .gtfs_schema import GTFS_Schema
+from .gtfs_time import hhmmss_to_seconds
+
+
+class GTFS_Feed(object):
+    """
+    Reads and validates the tables in a directory of GTFS files once
+    and hands out Service_Utils views for individual service dates
+    that share them.
+    """
+
+    # file name, schema and read_csv keywords for each table. Only the
+    # columns used by the package are read from the large tables:
+    _table_specs = {
+        "agency": ("agency.txt", GTFS_Schema.Agency, {}),
+        "calendar": ("calendar.txt", GTFS_Schema.Calendar, {}),
+        "calendar_dates": ("calendar_dates.txt", GTFS_Schema.Calendar_Dates, {}),
+        "trips": ("trips.txt", GTFS_Schema.Trips, {}),
+        "routes": ("routes.txt", GTFS_Schema.Routes, {}),
+        "stop_times": (
+            "stop_times.txt",
+            GTFS_Schema.Stop_Times,
+            {"usecols": GTFS_Schema.stop_times_columns},
+        ),
+        "stops": ("stops.txt", GTFS_Schema.Stops, {}),
+        "shapes": (
+            "shapes.txt",
+            GTFS_Schema.Shapes,
+            {"usecols": GTFS_Schema.shapes_columns},
+        ),
+        "frequencies": (
+            "frequencies.txt",
+            None,
+            {"dtype": {"trip_id": str, "start_time": str, "end_time": str}},
+        ),
+    }
+
+    # CSV readers that can be passed as engine:
+    engines = ["c", "python", "pyarrow", "polars"]
+
+    # levels that can be passed as validation:
+    validation_levels = ["full", "fast", "sample", "off"]
+
+    # rows validated in full by validation="sample":
+    sample_rows = 10000
+
+    # ID type of each column encoded by compact_ids:
+    _id_columns = {
+        "trip_id": "trip_id",
+        "rep_trip_id": "trip_id",
+        "orig_trip_id": "trip_id",
+        "stop_id": "stop_id",
+        "route_id": "route_id",
+        "shape_id": "shape_id",
+        "service_id": "service_id",
+    }
+
+    def __init__(
+        self,
+        gtfs_dir,
+        chunk_size=None,
+        engine="c",
+        compact_ids=False,
+        keep_tables=True,
+        profiler=None,
+        validation="full",
+        validation_cache=None,
+    ):
+        """
+        Instantiate class with a directory of GTFS files, the path to a
+        GTFS zip file or a file-like object holding one. Zip members are
+        read straight from the archive. Tables are read the first time
+        they are used. If chunk_size is given, stop_times.txt is streamed
+        in chunks of that many rows and only the rows for the trips in use
+        are kept, see get_stop_times.
+
+        engine selects the CSV reader: one of the pandas read_csv engines
+        ("c", "python" or "pyarrow") or "polars", which parses with
+        polars and converts to pandas. pyarrow and polars parse on
+        multiple threads. Chunked reads always use the "c" engine.
+
+        compact_ids stores trip_id, stop_id, route_id, shape_id and
+        service_id columns as pandas Categoricals that share one set of
+        categories per ID type across all tables, see encode_ids.
+
+        keep_tables=False hands each table out without holding on to it,
+        for feeds used by a single Service_Utils, which keeps the rows it
+        needs itself.
+
+        profiler is the Stage_Profiler that times reading and validating
+        each table, shared by the Service_Utils instances of the feed. A
+        new one is used if it is not given.
+
+        validation sets how tables are checked against GTFS_Schema:
+        "full" runs the pandera models, "fast" casts to the schema dtypes
+        and checks missing values and allowed values with vectorized
+        NumPy, see GTFS_Schema.fast_validate, "sample" casts like "fast"
+        and runs the pandera models on sample_rows random rows, and "off"
+        takes the tables as read. validation_cache is a Feed_Cache that
+        records the files that passed, by a hash of their contents, so
+        unchanged files are only cast and not validated again.
+        """
+        if engine not in self.engines:
+            raise ValueError(f"engine must be one of {self.engines}, got {engine!r}")
+        if validation not in self.validation_levels:
+            raise ValueError(
+                f"validation must be one of {self.validation_levels}, "
+                f"got {validation!r}"
+            )
+        self.gtfs_dir = gtfs_dir
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.compact_ids = compact_ids
+        self.keep_tables = keep_tables
+        self.profiler = Stage_Profiler() if profiler is None else profiler
+        self.validation = validation
+        self.validation_cache = validation_cache
+        self._id_categories = {}
+        self._tables = {}
+        self._zip = None
+        self._zip_members = None
+        if not (isinstance(gtfs_dir, (str, os.PathLike)) and Path(gtfs_dir).is_dir()):
+            self._zip = zipfile.ZipFile(gtfs_dir)
+            # keyed on file name, some feeds are zipped inside a folder:
+            self._zip_members = {
+                Path(name).name: name
+                for name in self._zip.namelist()
+                if not name.endswith("/")
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the zip file of the feed, if it was read from one. The
+        tables already read are kept, a table read later opens the zip
+        file again.
+        """
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def has_table(self, name):
+        """
+        Returns True if the feed includes the file for table name.
+        """
+        file_name = self._table_specs[name][0]
+        if self._zip_members is not None:
+            return file_name in self._zip_members
+        return Path(f"{self.gtfs_dir}/{file_name}").is_file()
+
+    def get_table(self, name):
+        """
+        Returns the validated DataFrame for table name, e.g. "stop_times".
+        The file is only read and validated the first time, unless the
+        feed was created with keep_tables=False.
+        """
+        if name in self._tables:
+            return self._tables[name]
+        table = self.__read_table(name)
+        if self.keep_tables:
+            self._tables[name] = table
+        return table
+
+    def get_stop_times(self, trip_ids):
+        """
+        Returns the validated records in stop_times.txt for trip_ids. If
+        chunk_size is set and the full table has not been read, the file is
+        streamed in chunks and only the rows for trip_ids are kept and
+        validated, so the full table is never held in memory. These rows
+        are not kept by the feed.
+        """
+        if self.chunk_size is None or "stop_times" in self._tables:
+            stop_times = self.get_table("stop_times")
+            return stop_times[stop_times["trip_id"].isin(trip_ids)]
+
+        trip_ids = set(trip_ids)
+        with self.profiler.stage("read_csv stop_times", rows_in=0) as record:
+            chunks = []
+            for chunk in self.__read_csv("stop_times", chunksize=self.chunk_size):
+                record["rows_in"] += len(chunk)
+                chunks.append(chunk[chunk["trip_id"].isin(trip_ids)])
+            stop_times = pd.concat(chunks, ignore_index=True)
+            record["rows_out"] = len(stop_times)
+        # only the rows kept are validated, so the file is not marked as
+        # validated:
+        return self.__validate("stop_times", stop_times, whole_file=False)
+
+    def encode_ids(self, df):
+        """
+        Returns df with its ID columns as pandas Categoricals. All columns
+        of one ID type, e.g. trip_id and rep_trip_id, share the same sorted
+        categories, so merges and groupbys between tables work on the
+        integer codes and sort in the same order as strings. IDs not seen
+        before are added to the categories and the tables already read are
+        recoded to match.
+        """
+        df = df.copy()
+        for col, id_type in self._id_columns.items():
+            if col not in df.columns:
+                continue
+            values = df[col].dropna().unique()
+            categories = self._id_categories.get(id_type)
+            if categories is None or not pd.Index(values).isin(categories).all():
+                new = pd.Index(values, dtype=object)
+                if categories is not None:
+                    new = categories.union(new)
+                categories = new.sort_values()
+                self._id_categories[id_type] = categories
+                self.__recode_ids(id_type)
+            df[col] = pd.Categorical(df[col], categories=categories)
+        return df
+
+    def __recode_ids(self, id_type):
+        """
+        Sets the categories of the id_type columns of the tables already
+        read to the current categories for id_type.
+        """
+        categories = self._id_categories[id_type]
+        for df in self._tables.values():
+            for col in df.columns:
+                if self._id_columns.get(col) == id_type and isinstance(
+                    df[col].dtype, pd.CategoricalDtype
+                ):
+                    df[col] = df[col].cat.set_categories(categories)
+
+    def clear(self):
+        """
+        Releases the tables read so far, they will be read again if
+        needed.
+        """
+        self._tables = {}
+
+    def get_service(self, service_date, cache=None, defer_shapes=False):
+        """
+        Returns a Service_Utils instance for service_date (YYYYMMDD)
+        built from the tables held by this feed.
+        """
+        from .gtfs_service import Service_Utils
+
+        return Service_Utils(
+            self.gtfs_dir, service_date, cache, feed=self, defer_shapes=defer_shapes
+        )
+
+    def get_services(self, service_dates, cache=None, defer_shapes=False):
+        """
+        Returns a dictionary of Service_Utils instances keyed by each
+        service_date in service_dates.
+        """
+        return {
+            service_date: self.get_service(service_date, cache, defer_shapes)
+            for service_date in service_dates
+        }
+
+    def get_active_service_ids(self, start_date, end_date):
+        """
+        Returns a DataFrame with a record for each service_id that runs on
+        each date from start_date to end_date (YYYYMMDD), inclusive.
+        """
+        return _decode_ids(self.__get_active_service_ids(start_date, end_date))
+
+    def __get_active_service_ids(self, start_date, end_date):
+        """
+        get_active_service_ids with service_id encoded if compact_ids.
+        """
+        dates = pd.date_range(
+            pd.to_datetime(str(start_date), format="%Y%m%d"),
+            pd.to_datetime(str(end_date), format="%Y%m%d"),
+        )
+        return get_active_service_ids(
+            self.get_table("calendar"),
+            self.get_table("calendar_dates"),
+            dates.strftime("%Y%m%d"),
+        )
+
+    def get_service_by_date_range(self, start_date, end_date):
+        """
+        Returns a DataFrame indexed by date with a record for each route_id
+        and direction_id running on each date from start_date to end_date
+        (YYYYMMDD), inclusive, with the total number of trips, their total
+        service time in minutes (total_line_time) and service_hours.
+        Metrics are computed once per service_id and summed for the
+        service_ids active on each date.
+        """
+        active = self.__get_active_service_ids(start_date, end_date)
+        metrics = self.__get_line_metrics_by_service_id()
+        line_cols = [c for c in ["route_id", "direction_id"] if c in metrics.columns]
+
+        df = active.merge(metrics, on="service_id")
+        df = df.groupby(["date"] + line_cols, as_index=False, observed=True)[
+            ["total_trips", "total_line_time"]
+        ].sum()
+        df["service_hours"] = df["total_line_time"] / 60
+        df["date"] = pd.to_datetime(df["date"].astype(str), format="%Y%m%d")
+        return _decode_ids(df.set_index("date"))
+
+    def __get_line_metrics_by_service_id(self):
+        """
+        Returns a DataFrame with the total number of trips and total service
+        time in minutes for each service_id, route_id and direction_id.
+        Trips in frequencies.txt count once for every trip they represent.
+        """
+        stop_times = self.get_table("stop_times")
+        trip_times = (
+            pd.DataFrame(
+                {
+                    "trip_id": stop_times["trip_id"].to_numpy(),
+                    "secs": hhmmss_to_seconds(stop_times["departure_time"]),
+                }
+            )
+            .groupby("trip_id", observed=True)["secs"]
+            .agg(["min", "max"])
+        )
+        trip_times["total_line_time"] = (trip_times["max"] - trip_times["min"]) / 60
+        trip_times["total_trips"] = 1
+
+        if self.has_table("frequencies"):
+            # same trip count as Service_Utils.frequencies_to_trips:
+            frequencies = self.get_table("frequencies")
+            total_trips = (
+                (
+                    (
+                        hhmmss_to_seconds(frequencies["end_time"])
+                        - hhmmss_to_seconds(frequencies["start_time"])
+                    )
+                    / frequencies["headway_secs"]
+                )
+                .round(0)
+                .astype(int)
+                .groupby(frequencies["trip_id"].astype(str))
+                .sum()
+            )
+            total_trips = total_trips[total_trips.index.isin(trip_times.index)]
+            trip_times.loc[total_trips.index, "total_trips"] = total_trips
+
+        trips = self.get_table("trips")
+        group_cols = ["service_id"] + [
+            c for c in ["route_id", "direction_id"] if c in trips.columns
+        ]
+        df = trips[group_cols + ["trip_id"]].merge(
+            trip_times[["total_trips", "total_line_time"]],
+            left_on="trip_id",
+            right_index=True,
+        )
+        df["total_line_time"] = df["total_line_time"] * df["total_trips"]
+        return df.groupby(group_cols, as_index=False, observed=True)[
+            ["total_trips", "total_line_time"]
+        ].sum()
+
+    def __read_table(self, name):
+        """
+        Reads and validates the file for table name. A missing
+        calendar_dates.txt is returned as an empty DataFrame.
+        """
+        if name == "calendar_dates" and not self.has_table(name):
+            df = pd.DataFrame(columns=GTFS_Schema.calendar_dates_columns)
+        else:
+            with self.profiler.stage(f"read_csv {name}") as record:
+                df = next(self.__read_csv(name))
+                record["rows_out"] = len(df)
+        return self.__validate(name, df)
+
+    def __validate(self, name, df, whole_file=True):
+        """
+        Returns df, read from the file for table name, validated against
+        the table's schema at the feed's validation level and with its ID
+        columns encoded if compact_ids. whole_file is False if df holds
+        only some of the file's rows.
+        """
+        schema = self._table_specs[name][1]
+        if schema is not None and self.validation != "off":
+            with self.profiler.stage(f"validate {name}", rows_in=len(df)) as record:
+                df = self.__validate_rows(name, schema, df, whole_file)
+                record["rows_out"] = len(df)
+        if self.compact_ids:
+            with self.profiler.stage(f"encode_ids {name}", rows_in=len(df)) as record:
+                df = self.encode_ids(df)
+                record["rows_out"] = len(df)
+        return df
+
+    def __validate_rows(self, name, schema, df, whole_file):
+        """
+        Returns df validated against schema at the feed's validation
+        level, or only cast to its dtypes if the file has passed before.
+        """
+        digest = None
+        if self.validation_cache is not None and self.has_table(name):
+            digest = self.__digest(name)
+            if self.validation_cache.is_validated(digest, self.validation):
+                return GTFS_Schema.coerce(schema, df)
+
+        if self.validation == "full":
+            df = schema.validate(df)
+        elif self.validation == "fast":
+            df = GTFS_Schema.fast_validate(schema, df)
+        else:
+            df = GTFS_Schema.coerce(schema, df)
+            if len(df) > self.sample_rows:
+                schema.validate(df.sample(self.sample_rows, random_state=0))
+            else:
+                schema.validate(df)
+
+        if digest is not None and whole_file:
+            self.validation_cache.set_validated(digest, self.validation)
+        return df
+
+    def __digest(self, name):
+        """
+        Returns a hash of the contents of the file for table name and of
+        the version of its schema.
+        """
+        file_name, schema, _ = self._table_specs[name]
+        digest = hashlib.sha256(f"{CACHE_VERSION}|{schema.__name__}".encode())
+        with self.__open(file_name) as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def __open(self, file_name):
+        """
+        Returns file_name, a file of the feed, opened for reading bytes.
+        """
+        if self._zip_members is None:
+            return open(Path(f"{self.gtfs_dir}/{file_name}"), "rb")
+        if self._zip is None:
+            # closed by close:
+            self._zip = zipfile.ZipFile(self.gtfs_dir)
+        return self._zip.open(self._zip_members[file_name])
+
+    def __read_header(self, file_name):
+        """
+        Returns the column names in the first line of file_name.
+        """
+        with self.__open(file_name) as f:
+            return pd.read_csv(f, nrows=0).columns.tolist()
+
+    def __read_csv(self, name, chunksize=None):
+        """
+        Generator that reads the file for table name using the read_csv
+        keywords for the table. Yields a single DataFrame, or one for
+        each chunk of chunksize rows.
+        """
+        file_name, schema, read_kwargs = self._table_specs[name]
+        if schema is not None:
+            read_kwargs = dict(read_kwargs, dtype=GTFS_Schema.get_read_dtypes(schema))
+            optional = GTFS_Schema.get_optional_columns(schema)
+            if optional and "usecols" in read_kwargs:
+                # optional columns are only read if the file has them:
+                missing = set(optional) - set(self.__read_header(file_name))
+                read_kwargs["usecols"] = [
+                    col for col in read_kwargs["usecols"] if col not in missing
+                ]
+                read_kwargs["dtype"] = {
+                    col: dtype
+                    for col, dtype in read_kwargs["dtype"].items()
+                    if col not in missing
+                }
+
+        with self.__open(file_name) as f:
+            if chunksize is None and self.engine == "polars":
+                yield _missing_to_nan(_read_csv_polars(f, **read_kwargs))
+            elif chunksize is None and self.engine == "pyarrow":
+                yield _read_csv_pyarrow(f, **read_kwargs)
+            elif chunksize is None:
+                yield pd.read_csv(f, engine=self.engine, **read_kwargs)
+            else:
+                # TextFileReader is only a context manager from pandas 1.2:
+                reader = pd.read_csv(f, chunksize=chunksize, **read_kwargs)
+                try:
+                    yield from reader
+                finally:
+                    reader.close()
+
+
+def _decode_ids(df):
+    """
+    Returns df with its categorical ID columns, as used by feeds read with
+    compact_ids, converted back to strings.
+    """
+    categorical = [
+        col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    if not categorical:
+        return df
+    return df.astype({col: object for col in categorical})
+
+
+def _read_csv_polars(f, usecols=None, dtype=None):
+    """
+    Reads a CSV file with polars and returns it as a pandas DataFrame.
+    usecols and dtype take the same values as in pandas.read_csv.
+    """
+    import polars as pl
+
+    polars_types = {str: pl.Utf8, float64: pl.Float64}
+    schema_overrides = {col: polars_types[t] for col, t in (dtype or {}).items()}
+    df = pl.read_csv(f, columns=usecols, schema_overrides=schema_overrides)
+    return df.to_pandas()
+
+
+def _read_csv_pyarrow(f, dtype=None, **read_kwargs):
+    """
+    Reads a CSV file with the pandas pyarrow engine. str columns are read
+    as pandas strings, the pyarrow engine would otherwise turn missing
+    values into "None".
+    """
+    dtype = {col: "string" if t is str else t for col, t in (dtype or {}).items()}
+    df = pd.read_csv(f, engine="pyarrow", dtype=dtype, **read_kwargs)
+    return _missing_to_nan(df)
+
+
+def _missing_to_nan(df):
+    """
+    Returns string columns as object columns with missing values as NaN,
+    as read by the pandas C parser.
+    """
+    for col in df.columns:
+        if df[col].dtype == object or isinstance(df[col].dtype, pd.StringDtype):
+            df[col] = df[col].astype(object).where(df[col].notna())
+    return df
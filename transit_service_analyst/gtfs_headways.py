@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+def get_headways(stop_times, keys, bin_edges, time_col="departure_time_mins"):
+    """
+    Returns a DataFrame with the number of departures and the mean and
+    maximum headway, in minutes, for each group of keys (e.g. ["stop_id"]
+    or ["stop_id", "route_id"]) in each time window. bin_edges are the
+    window boundaries in minutes after midnight, e.g. [360, 540, 900, 1140]
+    for AM peak, midday and PM peak. A headway is the time between
+    consecutive departures of a group within the same window, so a group
+    with a single departure in a window has no headway.
+
+    The rows are sorted once by group, window and time, and the headways
+    are the differences between neighbouring rows.
+    """
+    bin_edges = np.asarray(bin_edges, dtype=float)
+    times = stop_times[time_col].to_numpy(dtype=float)
+    bins = np.searchsorted(bin_edges, times, side="right") - 1
+    keep = (bins >= 0) & (bins < len(bin_edges) - 1) & ~np.isnan(times)
+
+    codes = []
+    uniques = []
+    for key in keys:
+        key_codes, key_uniques = pd.factorize(stop_times[key])
+        keep &= key_codes >= 0
+        codes.append(key_codes)
+        uniques.append(key_uniques)
+    times = times[keep]
+    bins = bins[keep]
+    codes = [key_codes[keep] for key_codes in codes]
+
+    # last key of lexsort is the primary one:
+    order = np.lexsort([times, bins] + codes[::-1])
+    times = times[order]
+    bins = bins[order]
+    codes = [key_codes[order] for key_codes in codes]
+
+    new_group = np.ones(len(times), dtype=bool)
+    if len(times):
+        new_group[1:] = bins[1:] != bins[:-1]
+        for key_codes in codes:
+            new_group[1:] |= key_codes[1:] != key_codes[:-1]
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    n_groups = len(starts)
+
+    # headways between rows of the same group:
+    same = ~new_group[1:]
+    headways = np.diff(times)[same]
+    headway_group = group[1:][same]
+    n_headways = np.bincount(headway_group, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_headway = (
+            np.bincount(headway_group, weights=headways, minlength=n_groups)
+            / n_headways
+        )
+    max_headway = np.full(n_groups, np.nan)
+    if len(headways):
+        # headway_group is sorted, so each group's headways are contiguous:
+        groups_with, first = np.unique(headway_group, return_index=True)
+        max_headway[groups_with] = np.maximum.reduceat(headways, first)
+
+    df = pd.DataFrame(
+        {
+            key: key_uniques.take(key_codes[starts])
+            for key, key_codes, key_uniques in zip(keys, codes, uniques)
+        }
+    )
+    df["window_start"] = bin_edges[bins[starts]]
+    df["window_end"] = bin_edges[bins[starts] + 1]
+    df["trips"] = np.diff(np.append(starts, len(times)))
+    df["mean_headway"] = mean_headway
+    df["max_headway"] = max_headway
+    return df
@@ -0,0 +1,127 @@
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Stage_Profiler(object):
+    """
+    Records the wall time, rows in and out and, optionally, the peak
+    memory of each stage of reading a feed and building and analyzing a
+    Service_Utils, e.g. parsing and validating stop_times.txt, expanding
+    frequencies, building shapes or detecting stop patterns.
+
+    Stages can run inside each other, e.g. building stop_times reads
+    stop_times.txt, so the time of a stage includes the stages it runs.
+    Each finished stage is logged at DEBUG level and passed to callback,
+    e.g. to forward it to a metrics system.
+    """
+
+    def __init__(self, trace_memory=False, callback=None):
+        """
+        trace_memory measures the peak memory allocated by each stage with
+        tracemalloc, which slows Python allocations down while on and
+        needs Python 3.9 or later.
+        callback is called with the record of each finished stage, a
+        dictionary with the keys of the columns of report.
+        """
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.records = []
+        self._open = []
+        self._tracing = False
+        # memory in use when each open stage started and its peak so far,
+        # keyed on id of the record:
+        self._start_memory = {}
+        self._peaks = {}
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Context manager that records the stage name run in its block. It
+        yields the record so rows_out, or rows_in if only known later, can
+        be set on it.
+        """
+        record = {
+            "stage": name,
+            "depth": len(self._open),
+            "seconds": None,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "peak_mb": None,
+        }
+        if self.trace_memory and not self._open:
+            # leaves tracemalloc alone if something else is tracing:
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+        if self._tracing:
+            self.__update_peaks()
+            self._start_memory[id(record)] = tracemalloc.get_traced_memory()[0]
+            self._peaks[id(record)] = self._start_memory[id(record)]
+        self.records.append(record)
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            if self._tracing:
+                self.__update_peaks()
+                record["peak_mb"] = (
+                    self._peaks.pop(id(record)) - self._start_memory.pop(id(record))
+                ) / 2**20
+            self._open.pop()
+            if self._tracing and not self._open:
+                tracemalloc.stop()
+                self._tracing = False
+            logger.debug(
+                "%s: %.3f s, %s rows in, %s rows out",
+                name,
+                record["seconds"],
+                record["rows_in"],
+                record["rows_out"],
+            )
+            if self.callback is not None:
+                self.callback(record)
+
+    def __update_peaks(self):
+        """
+        Folds the peak memory since the last stage started or finished
+        into all open stages, then resets it so a stage run inside another
+        only measures its own.
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self._open:
+            self._peaks[id(record)] = max(self._peaks[id(record)], peak)
+        tracemalloc.reset_peak()
+
+    def report(self):
+        """
+        Returns a DataFrame with a record for each stage in the order they
+        started, with its nesting depth, seconds, rows_in, rows_out and
+        peak_mb. peak_mb is only measured with trace_memory.
+        """
+        columns = ["stage", "depth", "seconds", "rows_in", "rows_out", "peak_mb"]
+        return pd.DataFrame(self.records, columns=columns)
+
+    def clear(self):
+        """
+        Drops the records of the stages so far.
+        """
+        self.records = []
+
+
+def count_rows(value):
+    """
+    Returns the number of rows of a DataFrame, or the length of a list or
+    dictionary, None for values without a length.
+    """
+    try:
+        return len(value)
+    except TypeError:
+        return None
@@ -0,0 +1,204 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+class Raptor(object):
+    """
+    Round-based (RAPTOR) earliest arrival router over a Timetable with
+    walking transfers between nearby stops. Each round rides every pattern
+    that serves a stop reached in the previous round and then walks from
+    the stops it improved, so round k finds journeys with k vehicles.
+
+    Times are minutes after midnight. Arrival and departure at a stop are
+    both taken from departure_time_mins and the trips of a pattern are
+    assumed not to overtake each other.
+    """
+
+    def __init__(self, timetable, transfers):
+        """
+        timetable: Timetable of the service_date.
+        transfers: DataFrame with from_stop_id, to_stop_id and minutes, the
+        walking time between each pair of stops that can be walked.
+        """
+        self.timetable = timetable
+        self.n_stops = len(timetable.stop_ids)
+
+        from_stops = timetable.stop_index(transfers["from_stop_id"])
+        to_stops = timetable.stop_index(transfers["to_stop_id"])
+        known = (from_stops >= 0) & (to_stops >= 0)
+        order = np.argsort(from_stops[known], kind="stable")
+        self.transfer_to = to_stops[known][order]
+        self.transfer_minutes = transfers["minutes"].to_numpy(dtype=float)[known][order]
+        self.transfer_offsets = np.searchsorted(
+            from_stops[known][order], np.arange(self.n_stops + 1)
+        )
+
+        # patterns serving each stop and the position of the stop in them:
+        tt = timetable
+        by_stop = np.argsort(tt.pattern_stops, kind="stable")
+        self.stop_pattern_offsets = np.searchsorted(
+            tt.pattern_stops[by_stop], np.arange(self.n_stops + 1)
+        )
+        self.stop_patterns = (
+            np.searchsorted(tt.pattern_offsets, by_stop, side="right") - 1
+        )
+        self.stop_pattern_positions = by_stop - tt.pattern_offsets[self.stop_patterns]
+
+        # trips x stops matrix of times for each pattern, trips in order of
+        # departure:
+        self.pattern_times = []
+        for pattern in range(len(tt.rep_trip_ids)):
+            trips = tt.pattern_trips[
+                tt.pattern_trip_offsets[pattern] : tt.pattern_trip_offsets[pattern + 1]
+            ]
+            n = tt.pattern_offsets[pattern + 1] - tt.pattern_offsets[pattern]
+            times = tt.event_times[tt.trip_offsets[trips][:, None] + np.arange(n)]
+            times = np.where(np.isnan(times), np.inf, times)
+            self.pattern_times.append(times[np.argsort(times[:, 0], kind="stable")])
+
+    def earliest_arrival(self, origins, departure_time, max_rounds=4):
+        """
+        Returns an array with the earliest arrival time at every stop,
+        in the order of the timetable's stop_ids, for leaving any of
+        origins (stop_ids) at departure_time. Unreachable stops are inf.
+        """
+        tt = self.timetable
+        best = np.full(self.n_stops, np.inf)
+        origins = tt.stop_index(np.atleast_1d(origins))
+        best[origins[origins >= 0]] = departure_time
+        marked = self.__walk(best, np.flatnonzero(best < np.inf))
+        previous = best.copy()
+
+        for _ in range(max_rounds):
+            improved = np.zeros(self.n_stops, dtype=bool)
+            for pattern, start in self.__patterns_at(marked).items():
+                stops = tt.pattern_stops[
+                    tt.pattern_offsets[pattern] : tt.pattern_offsets[pattern + 1]
+                ][start:]
+                times = self.pattern_times[pattern][:, start:]
+                # first trip each stop can board, then keep the earliest
+                # trip boarded at or before each stop:
+                board = (times < previous[stops]).sum(axis=0)
+                trip = np.minimum.accumulate(board)
+                on_trip = trip < len(times)
+                arrival = np.full(len(stops), np.inf)
+                arrival[on_trip] = times[trip[on_trip], np.flatnonzero(on_trip)]
+                better = arrival < best[stops]
+                # a stop can appear more than once in a pattern:
+                np.minimum.at(best, stops[better], arrival[better])
+                improved[stops[better]] = True
+            if not improved.any():
+                break
+            marked = self.__walk(best, np.flatnonzero(improved))
+            previous = best.copy()
+        return best
+
+    def __walk(self, best, stops):
+        """
+        Relaxes the walking transfers from stops and returns the stops
+        reached or improved.
+        """
+        counts = self.transfer_offsets[stops + 1] - self.transfer_offsets[stops]
+        edges = np.repeat(
+            self.transfer_offsets[stops] - np.cumsum(counts) + counts, counts
+        )
+        edges = edges + np.arange(counts.sum())
+        arrival = np.repeat(best[stops], counts) + self.transfer_minutes[edges]
+        to_stops = self.transfer_to[edges]
+        before = best.copy()
+        np.minimum.at(best, to_stops, arrival)
+        return np.union1d(stops, np.flatnonzero(best < before))
+
+    def __patterns_at(self, stops):
+        """
+        Returns a dictionary of each pattern serving stops to the first
+        position in it of one of stops.
+        """
+        counts = self.stop_pattern_offsets[stops + 1] - self.stop_pattern_offsets[stops]
+        entries = np.repeat(
+            self.stop_pattern_offsets[stops] - np.cumsum(counts) + counts, counts
+        ) + np.arange(counts.sum())
+        df = pd.DataFrame(
+            {
+                "pattern": self.stop_patterns[entries],
+                "position": self.stop_pattern_positions[entries],
+            }
+        )
+        return df.groupby("pattern")["position"].min().to_dict()
+
+    def travel_times(self, origins, departure_times, max_rounds=4, percentile=50):
+        """
+        Returns an array of the travel time in minutes from each of
+        origins (stop_ids) to every stop, in the order of the
+        timetable's stop_ids, at the given percentile over departure_times,
+        e.g. every minute of a departure window. Unreachable stops are inf.
+        """
+        matrix = np.empty((len(origins), self.n_stops))
+        for i, origin in enumerate(origins):
+            times = np.array(
+                [
+                    self.earliest_arrival(origin, departure, max_rounds) - departure
+                    for departure in departure_times
+                ]
+            )
+            matrix[i] = _nearest_percentile(times, percentile)
+        return matrix
+
+    def travel_time_matrix(
+        self,
+        origins,
+        departure_times,
+        max_rounds=4,
+        percentile=50,
+        max_workers=None,
+        chunk_size=16,
+    ):
+        """
+        Returns travel_times for origins, spread over a process pool of
+        max_workers processes in chunks of chunk_size origins. Each
+        worker receives the router once.
+        """
+        origins = list(origins)
+        chunks = [
+            origins[i : i + chunk_size] for i in range(0, len(origins), chunk_size)
+        ]
+        if max_workers == 1 or len(chunks) <= 1:
+            return self.travel_times(origins, departure_times, max_rounds, percentile)
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_set_worker_router, initargs=(self,)
+        ) as pool:
+            results = pool.map(
+                _worker_travel_times,
+                chunks,
+                [departure_times] * len(chunks),
+                [max_rounds] * len(chunks),
+                [percentile] * len(chunks),
+            )
+            return np.vstack(list(results))
+
+
+# router of a worker process, see Raptor.travel_time_matrix:
+_worker_router = None
+
+
+def _set_worker_router(router):
+    global _worker_router
+    _worker_router = router
+
+
+def _worker_travel_times(origins, departure_times, max_rounds, percentile):
+    return _worker_router.travel_times(origins, departure_times, max_rounds, percentile)
+
+
+def _nearest_percentile(values, percentile):
+    """
+    Returns the percentile of values along the first axis, taking the
+    nearest value rather than interpolating between two.
+    """
+    try:
+        return np.percentile(values, percentile, axis=0, method="nearest")
+    except TypeError:
+        # numpy before 1.22 names the keyword interpolation:
+        return np.percentile(values, percentile, axis=0, interpolation="nearest")
@@ -0,0 +1,117 @@
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from .load_gtfs import load_gtfs
+
+
+class Regional_Service(object):
+    """
+    Service_Utils instances for several GTFS feeds on one service_date,
+    keyed by feed name, as returned by load_gtfs_feeds.
+    """
+
+    def __init__(self, services, timings, errors):
+        """
+        services: dictionary of feed name to Service_Utils.
+        timings: dictionary of feed name to a dictionary with the seconds
+        spent building the feed in a worker (build) and attaching it in
+        this process (load).
+        errors: dictionary of feed name to the exception raised while
+        loading it, for the feeds that failed.
+        """
+        self.services = services
+        self.timings = timings
+        self.errors = errors
+
+    def __getitem__(self, name):
+        return self.services[name]
+
+    def get_merged(self, method, *args, **kwargs):
+        """
+        Returns the results of the Service_Utils method named method, e.g.
+        "get_total_trips_by_line", for all feeds in one DataFrame. A feed
+        column holds the feed name so IDs used by more than one agency
+        stay apart.
+        """
+        frames = []
+        for name, service in self.services.items():
+            df = getattr(service, method)(*args, **kwargs)
+            df.insert(0, "feed", name)
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True)
+
+
+def _build_feed(gtfs_dir, service_date, cache_dir, kwargs):
+    """
+    Builds the service for one feed into the Feed_Cache at cache_dir and
+    returns the seconds it took. Run in a worker process.
+    """
+    start = time.perf_counter()
+    # a cache miss builds every table and stores it:
+    load_gtfs(gtfs_dir, service_date, cache_dir=cache_dir, **kwargs)
+    return time.perf_counter() - start
+
+
+def load_gtfs_feeds(
+    gtfs_dirs, service_date, max_workers=None, cache_dir=None, **kwargs
+):
+    """
+    Loads several GTFS feeds for service_date (YYYYMMDD) in parallel and
+    returns a Regional_Service. gtfs_dirs is a dictionary of feed name to
+    the path of a directory of GTFS files or GTFS zip file, or a list of
+    paths named by their file name, which must then be unique. Each feed
+    is built in a process pool of max_workers processes and handed back
+    through a Feed_Cache, so the tables are written once as Parquet rather
+    than pickled through a pipe. cache_dir keeps the cache for later
+    calls, a temporary directory is used otherwise. Other keywords are
+    passed to load_gtfs.
+
+    A feed that fails is recorded in the errors of the result and does not
+    stop the others.
+    """
+    if not isinstance(gtfs_dirs, dict):
+        names = [Path(gtfs_dir).stem for gtfs_dir in gtfs_dirs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(
+                f"More than one feed is named {duplicates}, pass gtfs_dirs as "
+                "a dictionary of feed name to path."
+            )
+        gtfs_dirs = dict(zip(names, gtfs_dirs))
+    if cache_dir is None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            region = load_gtfs_feeds(
+                gtfs_dirs, service_date, max_workers, temp_dir, **kwargs
+            )
+        # tables not built yet are read from the feed later, which must not
+        # record validation in the deleted directory:
+        for service in region.services.values():
+            service.feed.validation_cache = None
+        return region
+
+    services = {}
+    timings = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_build_feed, gtfs_dir, service_date, cache_dir, kwargs): name
+            for name, gtfs_dir in gtfs_dirs.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                build = future.result()
+                start = time.perf_counter()
+                services[name] = load_gtfs(
+                    gtfs_dirs[name], service_date, cache_dir=cache_dir, **kwargs
+                )
+                timings[name] = {"build": build, "load": time.perf_counter() - start}
+            except Exception as e:
+                errors[name] = e
+    # in the order they were given:
+    services = {name: services[name] for name in gtfs_dirs if name in services}
+    return Regional_Service(services, timings, errors)
@@ -1,3 +1,6 @@
+import typing
+
+import numpy as np
 from numpy import float64
 from pandera.typing import Series
 import pandera as pa
@@ -51,7 +54,117 @@ class GTFS_Schema(object):
         shape_pt_lat: Series[float64] = pa.Field(coerce=True)
         shape_pt_lon: Series[float64] = pa.Field(coerce=True)
         shape_pt_sequence: Series[int] = pa.Field(coerce=True)
+        shape_dist_traveled: typing.Optional[Series[float64]] = pa.Field(
+            coerce=True, nullable=True
+        )
 
     trips_columns = list(Trips.__annotations__.keys())
+    stop_times_columns = list(Stop_Times.__annotations__.keys())
     calendar_dates_columns = list(Calendar_Dates.__annotations__.keys())
     shapes_columns = list(Shapes.__annotations__.keys())
+
+    @staticmethod
+    def get_read_dtypes(model):
+        """
+        Returns a dictionary of read_csv dtypes for the str and float
+        columns of model. Integer columns are left to the model's
+        coercion as they may hold missing values.
+        """
+        dtypes = {}
+        for column, annotation in model.__annotations__.items():
+            # typing.get_origin and get_args need Python 3.8:
+            if getattr(annotation, "__origin__", None) is typing.Union:
+                # optional columns are typing.Optional[Series[...]]:
+                annotation = annotation.__args__[0]
+            dtype = annotation.__args__[0]
+            if dtype in (str, float64):
+                dtypes[column] = dtype
+        return dtypes
+
+    @staticmethod
+    def get_optional_columns(model):
+        """
+        Returns a list of the columns of model that GTFS files may leave
+        out.
+        """
+        schema = model.to_schema()
+        return [
+            column for column, field in schema.columns.items() if not field.required
+        ]
+
+    @staticmethod
+    def coerce(model, df):
+        """
+        Returns df with the columns of model cast to the model's dtypes
+        with a single astype call, without running its checks. str columns
+        keep missing values missing, as pandera does. Raises a pandera
+        SchemaError if a column cannot be cast.
+        """
+        schema = model.to_schema()
+        casts = {}
+        for column, field in schema.columns.items():
+            if column not in df.columns:
+                continue
+            dtype = field.dtype.type
+            if str(field.dtype) == "str":
+                # str columns are read as str and need no cast:
+                if df[column].dtype != object:
+                    values = df[column]
+                    df = df.assign(**{column: values.astype(str).where(values.notna())})
+            elif df[column].dtype != dtype:
+                if not field.coerce:
+                    raise pa.errors.SchemaError(
+                        schema,
+                        df,
+                        f"expected column '{column}' to have type {dtype}, "
+                        f"got {df[column].dtype}",
+                    )
+                casts[column] = dtype
+        if casts:
+            try:
+                df = df.astype(casts)
+            except (TypeError, ValueError) as e:
+                raise pa.errors.SchemaError(schema, df, str(e)) from e
+        return df
+
+    @staticmethod
+    def fast_validate(model, df):
+        """
+        Returns df cast to the dtypes of model, see coerce, after checking
+        that it has the model's columns, that non-nullable columns have no
+        missing values and that isin fields hold only allowed values, each
+        with one vectorized pass over the column. Raises a pandera
+        SchemaError like model.validate, without its other checks.
+        """
+        schema = model.to_schema()
+        missing = [
+            column
+            for column, field in schema.columns.items()
+            if field.required and column not in df.columns
+        ]
+        if missing:
+            raise pa.errors.SchemaError(
+                schema, df, f"column(s) {missing} not in dataframe"
+            )
+        df = GTFS_Schema.coerce(model, df)
+        for column, field in schema.columns.items():
+            if column not in df.columns:
+                continue
+            values = df[column].to_numpy()
+            if not field.nullable and df[column].isna().any():
+                raise pa.errors.SchemaError(
+                    schema, df, f"non-nullable column '{column}' contains null values"
+                )
+            for check in field.checks:
+                if check.name != "isin":
+                    continue
+                allowed = check.statistics["allowed_values"]
+                failed = ~np.isin(values, allowed)
+                if failed.any():
+                    raise pa.errors.SchemaError(
+                        schema,
+                        df,
+                        f"column '{column}' has {failed.sum()} values not in "
+                        f"{allowed}, e.g. {values[failed][0]!r}",
+                    )
+        return df
@@ -1,13 +1,121 @@
-import time
-from datetime import datetime
+import copy
+import functools
+import logging
+import os
+import pickle
 from pathlib import Path
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from numpy import NaN
-from shapely.geometry import LineString
-
+import shapely
+
+from .gtfs_calendar import get_active_service_ids
+from .gtfs_diff import diff_hashes, hash_by
+from .gtfs_feed import GTFS_Feed, _decode_ids
+from .gtfs_headways import get_headways
+from .gtfs_profile import Stage_Profiler, count_rows
+from .gtfs_raptor import Raptor
 from .gtfs_schema import GTFS_Schema
+from .gtfs_shared import load_frame, save_frame
+from .gtfs_time import hhmmss_to_seconds, seconds_to_hhmmss
+from .gtfs_timetable import Timetable
+
+logger = logging.getLogger(__name__)
+
+# mean radius of the earth in meters:
+EARTH_RADIUS = 6371008.8
+
+
+class _Derived(object):
+    """
+    Service_Utils attribute that is built by func the first time it is
+    used and then stored on the instance. depends_on names the
+    attributes func uses.
+    """
+
+    def __init__(self, func, depends_on):
+        self.func = func
+        self.depends_on = depends_on
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        inputs = instance.__dict__
+        rows_in = {
+            name: count_rows(inputs[name]) for name in self.depends_on if name in inputs
+        }
+        with instance.profiler.stage(self.name) as record:
+            value = self.func(instance)
+            # dependencies built by func, some are dropped once used:
+            for name in self.depends_on:
+                if name not in rows_in and name in inputs:
+                    rows_in[name] = count_rows(inputs[name])
+            record["rows_in"] = sum(
+                rows for rows in rows_in.values() if rows is not None
+            )
+            record["rows_out"] = count_rows(value)
+        # stored under the same name, so later lookups skip this descriptor:
+        instance.__dict__[self.name] = value
+        return value
+
+
+def _derived(*depends_on):
+    """
+    Decorator for Service_Utils attributes built on first use from the
+    attributes named in depends_on.
+    """
+    return lambda func: _Derived(func, list(depends_on))
+
+
+def _profiled(method):
+    """
+    Decorator for Service_Utils analysis methods that records each call as
+    a stage of the instance's profiler. rows_in is the number of rows of
+    the stop level table the analyses read from.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.stage(method.__name__) as record:
+            result = method(self, *args, **kwargs)
+            for name in ["_df_all_stops_by_trips", "_trip_stop_times"]:
+                if name in self.__dict__:
+                    record["rows_in"] = len(self.__dict__[name])
+                    break
+            record["rows_out"] = count_rows(result)
+        return result
+
+    return wrapper
+
+
+def _memoized(method):
+    """
+    Decorator for Service_Utils analysis methods. The result is computed
+    once per instance and arguments, and each call returns a copy of it
+    so callers can change it freely. See Service_Utils.invalidate.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            result = self._results[key]
+            self._result_hits += 1
+        except KeyError:
+            result = method(self, *args, **kwargs)
+            self._results[key] = result
+            self._result_misses += 1
+        except TypeError:
+            # unhashable arguments, e.g. lists, are not memoized:
+            return method(self, *args, **kwargs)
+        return result.copy()
+
+    return wrapper
 
 
 class Service_Utils(object):
@@ -16,118 +124,535 @@ class Service_Utils(object):
     functions.
     """
 
-    def __init__(self, gtfs_dir, service_date):
+    # tables and derived DataFrames stored by a Feed_Cache:
+    _cached_frames = [
+        "calendar",
+        "calendar_dates",
+        "trips",
+        "stop_times",
+        "routes",
+        "stops",
+        "shapes",
+        "_df_all_stops_by_trips",
+        "schedule_pattern_df",
+    ]
+
+    # stored by export_shared as memory-mappable columns:
+    _shared_frames = ["stop_times", "_df_all_stops_by_trips"]
+
+    # units that service distances can be returned in, in meters:
+    distance_units = {"meters": 1.0, "km": 1000.0, "feet": 0.3048, "miles": 1609.344}
+
+    def __init__(
+        self,
+        gtfs_dir,
+        service_date,
+        cache=None,
+        feed=None,
+        defer_shapes=False,
+        profiler=None,
+    ):
         """
         Instantiate class with directory of GTFS Files and a service_date for
-        which to get service.
+        which to get service. Only the calendars and trips are read here,
+        the other tables and derived DataFrames are built the first time
+        they are used, see warm. An optional Feed_Cache is used to reuse the
+        tables built by an earlier instance for the same files and
+        service_date. Passing a GTFS_Feed shares its already read tables
+        instead of reading the files again. defer_shapes leaves line
+        geometry out of warm, it is built when shapes is first used, e.g.
+        by get_lines_gdf. profiler is the Stage_Profiler that times each
+        stage, by default the one of the feed, see timing_report.
         """
+        if feed is None:
+            feed = GTFS_Feed(gtfs_dir, keep_tables=False, profiler=profiler)
+        self.feed = feed
+        self.profiler = feed.profiler if profiler is None else profiler
         self.gtfs_dir = gtfs_dir
         self.service_date = service_date
         self.int_service_date = int(service_date)
         self._crs_epsg = 4326
+        self.defer_shapes = defer_shapes
+        self._frequencies = None
+        self._results = {}
+        self._result_hits = 0
+        self._result_misses = 0
+
+        cached = None
+        if cache is not None:
+            with self.profiler.stage("cache get") as record:
+                cache_key = cache.key(
+                    gtfs_dir, service_date, self.feed.compact_ids, self.feed.validation
+                )
+                cached = cache.get(cache_key)
+                if cached is None and self.feed.validation != "full":
+                    # an entry of a fully validated feed serves every level:
+                    cached = cache.get(
+                        cache.key(gtfs_dir, service_date, self.feed.compact_ids)
+                    )
+                record["rows_out"] = 0 if cached is None else len(cached[0])
+        if cached is not None:
+            self.__from_cache(*cached)
+            return
 
         # gtfs properties:
         self.calendar_dates = self.__get_calendar_dates()
         self.calendar = self.__get_calendar()
-        self.service_ids = self.__get_service_ids()
-        self.trips = self.__get_trips()
-        self.stop_times = self.__get_stop_times()
-
-        # deal with frequencies here:
-        if Path(f"{self.gtfs_dir}/frequencies.txt").is_file():
-            self.trips, self.stop_times = self.frequencies_to_trips()
-
-        # self._df_all_stops_by_trips = self.__get_trips_stop_times()
-        self.routes = self.__get_routes()
-        self.stop_list = self.stop_times["stop_id"].unique()
-        self.stops = self.__get_stops()
-        self.shapes = self.__get_shapes()
-        # find trips that dont have a coresponding shape:
-        self.trips_without_shapes = list(
-            self.trips[~self.trips["shape_id"].isin(self.shapes["shape_id"])][
-                "trip_id"
-            ].values
+        with self.profiler.stage("service_ids") as record:
+            self.service_ids = self.__get_service_ids()
+            record["rows_out"] = len(self.service_ids)
+        with self.profiler.stage("trips") as record:
+            self.trips = self.__get_trips()
+            record["rows_out"] = len(self.trips)
+
+        # deal with frequencies here, stop_times are expanded when read:
+        if self.feed.has_table("frequencies"):
+            self._frequencies = self.__get_frequencies(self.trips)
+            with self.profiler.stage(
+                "expand_frequency_trips", rows_in=len(self.trips)
+            ) as record:
+                self.trips = self.__expand_frequency_trips(
+                    self.trips, self._frequencies
+                )
+                if self.feed.compact_ids:
+                    # adds the trip_ids created for frequencies:
+                    self.trips = self.feed.encode_ids(self.trips)
+                record["rows_out"] = len(self.trips)
+
+        if cache is not None:
+            with self.profiler.stage("cache put"):
+                cache.put(cache_key, *self.__to_cache())
+
+    def warm(self):
+        """
+        Builds all tables and derived DataFrames now instead of the first
+        time they are used. Line geometry is left out if the instance was
+        created with defer_shapes. A feed that does not keep its tables,
+        e.g. one created by load_gtfs, is closed afterwards, see
+        GTFS_Feed.close.
+        """
+        for name in self._dependencies:
+            # _trip_stop_times is only kept until _df_all_stops_by_trips
+            # is built from it and _trip_hashes is only used by update:
+            if name in ("_trip_stop_times", "_trip_hashes") or (
+                name == "shapes" and self.defer_shapes
+            ):
+                continue
+            getattr(self, name)
+        if self.feed is not None and not self.feed.keep_tables:
+            self.feed.close()
+
+    def invalidate(self, *names):
+        """
+        Drops the memoized results of the get_* methods so they are
+        computed again. Tables named in names, e.g. "trips" after changing
+        it in place, cause the derived tables built from them to be
+        dropped too and rebuilt on next use. Tables cannot be rebuilt on an
+        instance returned by attach_shared, which has no feed to read.
+        """
+        if names and self.feed is None:
+            raise ValueError(
+                "Tables of an instance attached with attach_shared cannot be "
+                "rebuilt, attach it again or load the feed instead."
+            )
+        self._results = {}
+        stale = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for name, depends_on in self._dependencies.items():
+                if name not in stale and stale.intersection(depends_on):
+                    stale.add(name)
+                    changed = True
+        for name in stale & set(self._dependencies):
+            self.__dict__.pop(name, None)
+
+    def timing_report(self):
+        """
+        Returns a DataFrame with a record for each stage run so far by the
+        profiler: reading, validating and encoding each table, building
+        each derived table and each get_* call that was not answered from
+        memoized results. Records are in the order the stages started, with
+        their nesting depth, seconds, rows_in, rows_out and peak_mb, see
+        Stage_Profiler.
+        """
+        return self.profiler.report()
+
+    def result_cache_info(self):
+        """
+        Returns a dictionary with the number of get_* calls answered from
+        memoized results (hits), the number computed (misses) and the
+        number of results held (entries).
+        """
+        return {
+            "hits": self._result_hits,
+            "misses": self._result_misses,
+            "entries": len(self._results),
+        }
+
+    def export_shared(self, directory):
+        """
+        Builds all tables and writes them to directory for other
+        processes to attach with attach_shared. stop_times and
+        _df_all_stops_by_trips are written column by column as .npy
+        files, with text columns as integer codes, and timetable as its
+        arrays. The other, smaller tables are pickled.
+        """
+        self.warm()
+        self.timetable
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self._shared_frames:
+            save_frame(getattr(self, name), directory / name)
+        self.timetable.save(directory / "timetable")
+
+        # the feed and file-like objects cannot be pickled, the STRtree
+        # is rebuilt on first use:
+        skip = self._shared_frames + [
+            "feed",
+            "profiler",
+            "timetable",
+            "_stop_index",
+            "_results",
+        ]
+        state = {
+            name: value for name, value in self.__dict__.items() if name not in skip
+        }
+        if not isinstance(self.gtfs_dir, (str, os.PathLike)):
+            state["gtfs_dir"] = None
+        with open(directory / "service.pkl", "wb") as f:
+            pickle.dump(state, f)
+
+    @classmethod
+    def attach_shared(cls, directory):
+        """
+        Returns the Service_Utils written to directory by export_shared.
+        stop_times, _df_all_stops_by_trips and timetable are memory-mapped
+        read-only rather than read, so processes that attach the same
+        directory share one physical copy of them. Their text columns are
+        pandas Categoricals. An attached instance does not read the GTFS
+        files, so its tables cannot be rebuilt with invalidate.
+        """
+        directory = Path(directory)
+        service = cls.__new__(cls)
+        with open(directory / "service.pkl", "rb") as f:
+            service.__dict__.update(pickle.load(f))
+        service.feed = None
+        service.profiler = Stage_Profiler()
+        service._results = {}
+        for name in cls._shared_frames:
+            setattr(service, name, load_frame(directory / name))
+        service.timetable = Timetable.load(directory / "timetable")
+        return service
+
+    def update(self, gtfs_dir, feed=None, cache=None):
+        """
+        Returns a Service_Utils for the same service_date built from a
+        new version of the feed in gtfs_dir, and a DataFrame with the
+        table, id and change ("added", "removed" or "modified") of each
+        route, trip, shape and stop that differs from this instance.
+
+        The stop patterns and _df_all_stops_by_trips are only rebuilt for
+        routes with an added, removed or modified trip (including its
+        stop_times), and line geometry only for added or modified shapes.
+        The rest is reused from this instance, e.g. one loaded from a
+        Feed_Cache, if it has been built. The new instance is put in cache
+        if one is passed.
+        """
+        if feed is None and self.feed is not None:
+            feed = GTFS_Feed(
+                gtfs_dir,
+                self.feed.chunk_size,
+                self.feed.engine,
+                self.feed.compact_ids,
+                keep_tables=False,
+                profiler=Stage_Profiler(
+                    self.profiler.trace_memory, self.profiler.callback
+                ),
+                validation=self.feed.validation,
+                validation_cache=self.feed.validation_cache,
+            )
+        new = Service_Utils(
+            gtfs_dir, self.service_date, feed=feed, defer_shapes=self.defer_shapes
+        )
+
+        with new.profiler.stage("diff trips") as record:
+            trip_changes = diff_hashes(self._trip_hashes, new._trip_hashes, "trips")
+            record["rows_out"] = len(trip_changes)
+        changed_routes = set(
+            _decode_ids(
+                pd.concat(
+                    [
+                        trips.loc[
+                            trips["trip_id"].isin(trip_changes["id"]), ["route_id"]
+                        ]
+                        for trips in [self.trips, new.trips]
+                    ]
+                )
+            )["route_id"].dropna()
         )
-        if self.trips_without_shapes:
-            print("WARNING: There are trips without corresponding shapes in this feed!")
-            print(
-                "Please use the .trips_without_shapes method to see a list of trip_ids."
+        route_changes = diff_hashes(
+            hash_by(self.routes, "route_id"), hash_by(new.routes, "route_id"), "routes"
+        )
+        # routes that are still served but have changed trips:
+        trips_changed = sorted(
+            changed_routes.intersection(_decode_ids(new.routes)["route_id"])
+            - set(route_changes["id"])
+        )
+        route_changes = pd.concat(
+            [
+                route_changes,
+                pd.DataFrame(
+                    {"table": "routes", "id": trips_changed, "change": "modified"}
+                ),
+            ],
+            ignore_index=True,
+        )
+
+        built = {"_df_all_stops_by_trips", "_schedule_pattern_dict"}
+        if built.issubset(self.__dict__):
+            self.__splice_patterns(new, changed_routes)
+
+        old_shapes = self.__shape_hashes()
+        new_shapes = new.__shape_hashes()
+        shape_changes = diff_hashes(old_shapes, new_shapes, "shapes")
+        if "shapes" in self.__dict__ and new._shape_points is not None:
+            self.__splice_shapes(new, shape_changes)
+
+        stop_changes = diff_hashes(
+            hash_by(pd.DataFrame(self.stops.drop(columns="geometry")), "stop_id"),
+            hash_by(pd.DataFrame(new.stops.drop(columns="geometry")), "stop_id"),
+            "stops",
+        )
+
+        if cache is not None:
+            cache.put(
+                cache.key(
+                    gtfs_dir,
+                    self.service_date,
+                    new.feed.compact_ids,
+                    new.feed.validation,
+                ),
+                *new.__to_cache(),
             )
+        changes = pd.concat(
+            [route_changes, trip_changes, shape_changes, stop_changes],
+            ignore_index=True,
+        )
+        return new, changes
 
-        # derived DataFrames
-        self._df_all_stops_by_trips = self.__get_trips_stop_times()
-        self._schedule_pattern_dict = self.__get_schedule_pattern()
-        self.schedule_pattern_df = self.__get_schedule_pattern_df()
-        self._df_all_stops_by_trips = self._df_all_stops_by_trips.merge(
-            self.schedule_pattern_df[["orig_trip_id", "rep_trip_id"]],
-            how="left",
-            left_on="trip_id",
-            right_on="orig_trip_id",
-        ).drop(columns=["orig_trip_id"])
-        # self.__trip_list = self.__get_trip_list()
-        self.__rep_trip_list = list(self.schedule_pattern_df.rep_trip_id.unique())
-        self.rep_trips_without_shapes = list(
-            set(self.trips_without_shapes) & set(self.__rep_trip_list)
+    @_derived("trips", "stop_times")
+    def _trip_hashes(self):
+        """
+        Series with a hash of each trip's record in trips and its
+        stop_times, see hash_by. Kept so later updates of an instance
+        returned by update do not hash it again.
+        """
+        trip_hashes = hash_by(self.trips, "trip_id")
+        stop_time_hashes = hash_by(self.stop_times, "trip_id").reindex(
+            trip_hashes.index, fill_value=0
+        )
+        # wraps around like the sums in hash_by:
+        return trip_hashes + stop_time_hashes.to_numpy()
+
+    def __shape_hashes(self):
+        """
+        Returns a Series with a hash of the coordinates of each shape with
+        line geometry, taken from shapes if it has been built and otherwise
+        from _sorted_shape_points, so geometry is not built just to compare it.
+        """
+        if "shapes" in self.__dict__:
+            shapes = self.shapes
+            if not len(shapes):
+                return hash_by(pd.DataFrame({"shape_id": []}), "shape_id")
+            coords, index = shapely.get_coordinates(
+                shapes.geometry.values, return_index=True
+            )
+            shape_ids = shapes["shape_id"].to_numpy()[index]
+        else:
+            points = self._sorted_shape_points
+            if points is None:
+                return hash_by(pd.DataFrame({"shape_id": []}), "shape_id")
+            coords = points[["shape_pt_lon", "shape_pt_lat"]].to_numpy()
+            shape_ids = points["shape_id"].to_numpy()
+        df = pd.DataFrame({"shape_id": shape_ids, "x": coords[:, 0], "y": coords[:, 1]})
+        df["position"] = df.groupby("shape_id", sort=False).cumcount()
+        return hash_by(df, "shape_id")
+
+    def __subset(self, trips):
+        """
+        Returns a copy of this instance limited to trips and their
+        stop_times, without the derived attributes built so far.
+        """
+        part = copy.copy(self)
+        for name in self._dependencies:
+            part.__dict__.pop(name, None)
+        part._results = {}
+        part.trips = trips
+        part.stop_times = self.stop_times[
+            self.stop_times["trip_id"].isin(trips["trip_id"])
+        ]
+        return part
+
+    def __splice(self, frames, sort_by):
+        """
+        Returns frames concatenated in the row order of a full build,
+        sorted by sort_by, with ID columns encoded if the feed uses
+        compact_ids.
+        """
+        df = pd.concat(frames).sort_values(sort_by, kind="stable", ignore_index=True)
+        if self.feed.compact_ids:
+            df = self.feed.encode_ids(df)
+        return df
+
+    def __splice_patterns(self, new, changed_routes):
+        """
+        Sets the stop patterns and _df_all_stops_by_trips of new from this
+        instance for unchanged routes and rebuilds them for
+        changed_routes.
+        """
+        part = new.__subset(
+            new.trips[
+                new.trips["route_id"].isin(changed_routes)
+                | new.trips["route_id"].isna()
+            ]
+        )
+
+        def unchanged(df):
+            return df[df["route_id"].notna() & ~df["route_id"].isin(changed_routes)]
+
+        patterns = {
+            route_id: trips
+            for route_id, trips in self._schedule_pattern_dict.items()
+            if route_id not in changed_routes
+        }
+        stops_by_trips = [unchanged(self._df_all_stops_by_trips)]
+        pattern_dfs = [unchanged(self.schedule_pattern_df)]
+        if len(part.trips):
+            patterns.update(part._schedule_pattern_dict)
+            pattern_dfs.append(part.schedule_pattern_df)
+            stops_by_trips.append(part._df_all_stops_by_trips)
+        new._df_all_stops_by_trips = new.__splice(
+            stops_by_trips, ["trip_id", "stop_sequence"]
+        )
+        new.schedule_pattern_df = new.__splice(pattern_dfs, ["orig_trip_id"])
+        # in the order of a full build, by each route's first trip:
+        new._schedule_pattern_dict = {
+            route_id: dict(sorted(trips.items()))
+            for route_id, trips in sorted(
+                patterns.items(), key=lambda item: min(item[1])
+            )
+        }
+
+    def __splice_shapes(self, new, shape_changes):
+        """
+        Sets the line geometry of new from this instance for unchanged
+        shapes and builds it for added and modified ones.
+        """
+        changed = shape_changes.loc[shape_changes["change"] != "removed", "id"]
+        points = new._shape_points
+        part = copy.copy(new)
+        part._shape_points = points[points["shape_id"].isin(changed)]
+        part.__dict__.pop("_sorted_shape_points", None)
+        part.__dict__.pop("shapes", None)
+        kept = self.shapes[
+            self.shapes["shape_id"].isin(points["shape_id"])
+            & ~self.shapes["shape_id"].isin(changed)
+        ]
+        new.shapes = gpd.GeoDataFrame(
+            new.__splice([kept, part.shapes], ["shape_id"]),
+            crs=f"EPSG:{self._crs_epsg}",
         )
 
+    def __to_cache(self):
+        """
+        Returns the DataFrames and metadata stored in a Feed_Cache entry.
+        """
+        frames = {name: getattr(self, name) for name in self._cached_frames}
+        meta = {
+            "service_ids": list(self.service_ids),
+            "schedule_pattern_dict": self._schedule_pattern_dict,
+        }
+        return frames, meta
+
+    def __from_cache(self, frames, meta):
+        """
+        Sets the tables and derived DataFrames from a Feed_Cache entry.
+        """
+        for name in self._cached_frames:
+            setattr(self, name, frames[name])
+        self.service_ids = meta["service_ids"]
+        self._schedule_pattern_dict = meta["schedule_pattern_dict"]
+
     def __get_calendar(self):
         """
         Returns calendar.txt as a DataFrame.
         """
-        calendar_df = pd.read_csv(Path(f"{self.gtfs_dir}/calendar.txt"))
-        return GTFS_Schema.Calendar.validate(calendar_df)
+        return self.feed.get_table("calendar")
 
     def __get_calendar_dates(self):
         """
         Returns calendar_dates.txt as a DataFrame.
         """
-        if Path(f"{self.gtfs_dir}/calendar_dates.txt").is_file():
-            calendar_dates = pd.read_csv(Path(f"{self.gtfs_dir}/calendar_dates.txt"))
-        else:
-            calendar_dates = pd.DataFrame(columns=GTFS_Schema.calendar_dates_columns)
-
-        return GTFS_Schema.Calendar_Dates.validate(calendar_dates)
+        return self.feed.get_table("calendar_dates")
 
     def __get_trips(self):
         """
         Gets records in trips.txt for the service_ids that represent
         the service_date passed into the constructor. Returns a DataFrame.
         """
-        trips_df = pd.read_csv(Path(f"{self.gtfs_dir}/trips.txt"))
-        trips_df = GTFS_Schema.Trips.validate(trips_df)
+        trips_df = self.feed.get_table("trips")
         trips_df = trips_df[trips_df["service_id"].isin(self.service_ids)]
 
         return trips_df
 
-    def __get_routes(self) -> pd.DataFrame:
+    @_derived("trips")
+    def routes(self):
         """
-        Gets records in routes.txt for the trips that represent the
-        service_date passed into the constructor. Returns a DataFrame.
+        Records in routes.txt for the trips that represent the
+        service_date passed into the constructor.
         """
-        routes_df = pd.read_csv(Path(f"{self.gtfs_dir}/routes.txt"))
-        routes_df = GTFS_Schema.Routes.validate(routes_df)
+        routes_df = self.feed.get_table("routes")
         routes_df = routes_df[routes_df["route_id"].isin(self.trips["route_id"])]
         return routes_df
 
-    def __get_stop_times(self):
+    @_derived("trips")
+    def stop_times(self):
         """
-        Gets records in stop_times.txt for the trips that represent
-        the service_date passed into the constructor. Returns a DataFrame.
+        Records in stop_times.txt for the trips that represent the
+        service_date passed into the constructor, including the trips
+        created for frequencies.
         """
-        stop_times_df = pd.read_csv(Path(f"{self.gtfs_dir}/stop_times.txt"))
-        stop_times_df = GTFS_Schema.Stop_Times.validate(stop_times_df)
-        stop_times_df = stop_times_df[
-            stop_times_df["trip_id"].isin(self.trips["trip_id"])
-        ]
-        return stop_times_df
+        trip_ids = self.trips["trip_id"]
+        if self._frequencies is None:
+            return self.feed.get_stop_times(trip_ids)
+        trip_ids = pd.concat([trip_ids, self._frequencies["trip_id"]])
+        stop_times = self.feed.get_stop_times(trip_ids)
+        with self.profiler.stage(
+            "expand_frequency_stop_times", rows_in=len(stop_times)
+        ) as record:
+            stop_times = self.__expand_frequency_stop_times(
+                stop_times, self._frequencies
+            )
+            record["rows_out"] = len(stop_times)
+        if self.feed.compact_ids:
+            stop_times = self.feed.encode_ids(stop_times)
+        return stop_times
 
-    def __get_stops(self):
+    @_derived("stop_times")
+    def stop_list(self):
         """
-        Gets records in stops.txt for the stops used by trips represented in
-        the service_date passed into the constructor. Returns a DataFrame.
+        Array of the stop_ids served on the service_date.
+        """
+        return self.stop_times["stop_id"].unique()
+
+    @_derived("stop_list")
+    def stops(self):
         """
-        stops_gdf = pd.read_csv(Path(f"{self.gtfs_dir}/stops.txt"))
-        stops_gdf = GTFS_Schema.Stops.validate(stops_gdf)
+        GeoDataFrame of the records in stops.txt for the stops used by
+        trips represented in the service_date passed into the constructor.
+        """
+        stops_gdf = self.feed.get_table("stops")
         stops_gdf = stops_gdf[stops_gdf["stop_id"].isin(self.stop_list)]
         stops_gdf = gpd.GeoDataFrame(
             stops_gdf,
@@ -136,88 +661,227 @@ class Service_Utils(object):
         stops_gdf = stops_gdf.set_crs(epsg=self._crs_epsg)
         return stops_gdf
 
-    def __get_shapes(self):
+    @_derived("trips")
+    def _shape_points(self):
         """
-        Gets records in shapes.txt for the shape_ids in trips that represent
-        the service_date passed into the constructor. The sequence of points
-        are converted to line geometry and returned as a GeoDataFrame.
+        Records in shapes.txt for the shape_ids in trips that represent the
+        service_date passed into the constructor, None if the feed has no
+        shapes.txt.
         """
-        if Path(f"{self.gtfs_dir}/shapes.txt").is_file():
-            gdf = pd.read_csv(
-                Path(f"{self.gtfs_dir}/shapes.txt"), dtype={"shape_id": str}
-            )
-            gdf = GTFS_Schema.Shapes.validate(gdf)
-            gdf = gdf[gdf["shape_id"].isin(self.trips["shape_id"])]
-            gdf = gpd.GeoDataFrame(
-                gdf,
-                geometry=gpd.points_from_xy(gdf["shape_pt_lon"], gdf["shape_pt_lat"]),
-            )
-            gdf = gpd.GeoDataFrame(
-                gdf.groupby("shape_id")["geometry"].apply(
-                    lambda x: LineString(x.tolist())
-                )
-            )
-            gdf.reset_index(inplace=True)
-            gdf = gdf.set_crs(epsg=self._crs_epsg)
+        if not self.feed.has_table("shapes"):
+            return None
+        points = self.feed.get_table("shapes")
+        return points[points["shape_id"].isin(self.trips["shape_id"])]
 
-        else:
+    @_derived("_shape_points")
+    def _sorted_shape_points(self):
+        """
+        _shape_points ordered by shape_id and shape_pt_sequence, without
+        the shapes that have fewer than two points and so no line geometry.
+        None if the feed has no shapes.txt.
+        """
+        if self._shape_points is None:
+            return None
+        points = self._shape_points.sort_values(
+            ["shape_id", "shape_pt_sequence"], kind="stable"
+        )
+        n_points = points.groupby("shape_id", observed=True)["shape_id"].transform(
+            "size"
+        )
+        return points[n_points >= 2]
+
+    @_derived("_sorted_shape_points")
+    def shapes(self):
+        """
+        GeoDataFrame of line geometry for the shape_ids used by trips that
+        represent the service_date, ordered by shape_pt_sequence. Lines are
+        built from the coordinate arrays in one call, shapes with fewer
+        than two points are left out.
+        """
+        points = self._sorted_shape_points
+        if points is None:
             gdf = gpd.GeoDataFrame(columns=GTFS_Schema.shapes_columns)
-            print("WARNING: shapes.txt is missing from this feed! functions...")
-            print("that return GeodataFrames will have empty geometries!")
+            logger.warning(
+                "shapes.txt is missing from this feed! functions that return "
+                "GeodataFrames will have empty geometries!"
+            )
+            return gdf
 
-        return gdf
+        # codes increase with shape_id, as the indices argument requires:
+        codes, shape_ids = pd.factorize(points["shape_id"], sort=True)
+        lines = shapely.linestrings(
+            points[["shape_pt_lon", "shape_pt_lat"]].to_numpy(), indices=codes
+        )
+        return gpd.GeoDataFrame(
+            {"shape_id": shape_ids}, geometry=lines, crs=f"EPSG:{self._crs_epsg}"
+        )
 
-    def __get_service_ids(self):
+    def __get_shape_ids(self):
         """
-        Returns a list of valid service_id(s) from each feed using the user
-        specified service_date.
+        Returns the shape_ids that have line geometry, without building the
+        geometry if it has not been built yet.
+        """
+        if "shapes" in self.__dict__ or self._sorted_shape_points is None:
+            return self.shapes["shape_id"]
+        return self._sorted_shape_points["shape_id"].unique()
+
+    @_derived("_sorted_shape_points")
+    def _shape_lengths(self):
+        """
+        DataFrame with the length in meters of each shape with line
+        geometry, the sum of the haversine distances between its points in
+        shape_pt_sequence order, and shape_dist, the span of its
+        shape_dist_traveled in the units of the feed, NaN if shapes.txt
+        leaves it out.
+        """
+        columns = ["shape_id", "length", "shape_dist"]
+        points = self._sorted_shape_points
+        if points is None:
+            return pd.DataFrame(columns=columns)
+        codes, shape_ids = pd.factorize(points["shape_id"], sort=True)
+        lon = np.radians(points["shape_pt_lon"].to_numpy())
+        lat = np.radians(points["shape_pt_lat"].to_numpy())
+        same_shape = codes[1:] == codes[:-1]
+        segments = _haversine(lon[:-1], lat[:-1], lon[1:], lat[1:])
+        lengths = pd.DataFrame(
+            {
+                "shape_id": shape_ids,
+                "length": np.bincount(
+                    codes[1:][same_shape],
+                    weights=segments[same_shape],
+                    minlength=len(shape_ids),
+                ),
+                "shape_dist": np.nan,
+            }
+        )
+        if "shape_dist_traveled" in points.columns:
+            shape_dist = points.groupby(codes)["shape_dist_traveled"].agg(
+                ["min", "max"]
+            )
+            lengths["shape_dist"] = (shape_dist["max"] - shape_dist["min"]).to_numpy()
+        return lengths[columns]
+
+    @_derived("trips", "_sorted_shape_points")
+    def trips_without_shapes(self):
+        """
+        List of the trip_ids that do not have a corresponding shape.
         """
-        my_date = datetime(
-            int(self.service_date[0:4]),
-            int(self.service_date[4:6]),
-            int(self.service_date[6:8]),
+        trips_without_shapes = list(
+            self.trips[~self.trips["shape_id"].isin(self.__get_shape_ids())][
+                "trip_id"
+            ].values
         )
-        day_of_week = self.__get_weekday(my_date)
+        if trips_without_shapes:
+            logger.warning(
+                "There are trips without corresponding shapes in this feed! "
+                "Please use the .trips_without_shapes method to see a list of "
+                "trip_ids."
+            )
+        return trips_without_shapes
+
+    @_derived("schedule_pattern_df")
+    def _rep_trip_list(self):
+        """
+        List of the trip_ids that represent each unique stop pattern.
+        """
+        return list(self.schedule_pattern_df.rep_trip_id.unique())
 
-        regular_service_dates = self.calendar[
-            (self.calendar["start_date"] <= self.int_service_date)
-            & (self.calendar["end_date"] >= self.int_service_date)
-            & (self.calendar[day_of_week] == 1)
-        ]["service_id"].tolist()
+    @_derived("trips_without_shapes", "_rep_trip_list")
+    def rep_trips_without_shapes(self):
+        """
+        List of the representative trip_ids that do not have a
+        corresponding shape.
+        """
+        return list(set(self.trips_without_shapes) & set(self._rep_trip_list))
 
-        exceptions_df = self.calendar_dates[
-            self.calendar_dates["date"] == self.int_service_date
+    @_derived("_df_all_stops_by_trips")
+    def _rep_trip_stops(self):
+        """
+        DataFrame linking each stop_id to the route_id and rep_trip_id of
+        the representative trips that serve it.
+        """
+        df = self._df_all_stops_by_trips[
+            self._df_all_stops_by_trips["trip_id"]
+            == self._df_all_stops_by_trips["rep_trip_id"]
         ]
+        return df[["stop_id", "route_id", "rep_trip_id"]].drop_duplicates()
 
-        add_service = exceptions_df.loc[exceptions_df["exception_type"] == 1][
-            "service_id"
-        ].tolist()
+    @_derived("_df_all_stops_by_trips")
+    def trip_summary(self):
+        """
+        DataFrame with a record for each trip with its rep_trip_id,
+        route_id, direction_id and shape_id, the number of stops it makes
+        and the departure of its first and last stop in minutes after
+        midnight, and of its first stop in whole hours. Built in one
+        sorted pass over _df_all_stops_by_trips and used by the line level
+        get_* methods, so they do not group the stop level table.
+        """
+        df = self._df_all_stops_by_trips
+        codes, _ = pd.factorize(df["trip_id"], sort=True)
+        order = np.lexsort((df["stop_sequence"].to_numpy(), codes))
+        codes = codes[order]
+        # positions in sorted order where each trip starts, codes are never
+        # -1 so the first row is one:
+        starts = np.flatnonzero(np.diff(codes, prepend=-1) != 0)
+        stop_counts = np.diff(np.append(starts, len(codes)))
+        first = order[starts]
+        last = order[starts + stop_counts - 1]
+
+        columns = ["trip_id", "rep_trip_id", "route_id", "direction_id", "shape_id"]
+        summary = df[[col for col in columns if col in df.columns]]
+        summary = summary.iloc[first].reset_index(drop=True)
+        summary["stop_count"] = stop_counts
+        departures = df["departure_time_mins"].to_numpy()
+        summary["first_departure_mins"] = departures[first]
+        summary["last_departure_mins"] = departures[last]
+        summary["first_departure_hrs"] = df["departure_time_hrs"].to_numpy()[first]
+        return summary
+
+    def __with_line_columns(self, df):
+        """
+        Returns df with the route_id and direction_id of the trip in its
+        rep_trip_id column.
+        """
+        summary = self.trip_summary
+        rep_trips = summary[summary["trip_id"] == summary["rep_trip_id"]]
+        columns = [col for col in ["route_id", "direction_id"] if col in summary]
+        return df.merge(
+            rep_trips[["rep_trip_id"] + columns], how="left", on="rep_trip_id"
+        )
 
-        remove_service = exceptions_df[exceptions_df["exception_type"] == 2][
-            "service_id"
-        ].tolist()
+    @_derived("_df_all_stops_by_trips")
+    def timetable(self):
+        """
+        Timetable of the service_date in CSR arrays for next departure and
+        in-vehicle time queries, see Timetable.
+        """
+        return Timetable.from_stops_by_trips(self._df_all_stops_by_trips)
 
-        service_id_list = [
-            x for x in (add_service + regular_service_dates) if x not in remove_service
-        ]
+    @_derived("stops")
+    def _projected_crs(self):
+        """
+        Metric CRS used by the spatial queries, the UTM zone of the stops.
+        """
+        return self.stops.estimate_utm_crs()
 
-        assert service_id_list, "No service found in feed."
-        return service_id_list
+    @_derived("stops", "_projected_crs")
+    def _stop_index(self):
+        """
+        STRtree of the stops in _projected_crs, in the order of stops.
+        """
+        return shapely.STRtree(self.stops.to_crs(self._projected_crs).geometry.values)
 
-    def __get_weekday(self, my_date):
+    def __get_service_ids(self):
         """
-        Gets the day of week from user parameter service date.
+        Returns a list of valid service_id(s) from each feed using the user
+        specified service_date.
         """
-        week_days = [
-            "monday",
-            "tuesday",
-            "wednesday",
-            "thursday",
-            "friday",
-            "saturday",
-            "sunday",
-        ]
-        return week_days[my_date.weekday()]
+        service_id_list = get_active_service_ids(
+            self.calendar, self.calendar_dates, [self.service_date]
+        )["service_id"].tolist()
+
+        assert service_id_list, "No service found in feed."
+        return service_id_list
 
     def __make_sequence_col(self, data_frame, sort_list, group_by_col, seq_col):
         """
@@ -230,7 +894,9 @@ class Service_Utils(object):
         data_frame = data_frame.sort_values(sort_list, ascending=[1, 1])
         # create a new field, set = to the position of each record in a group,
         # grouped by tripId
-        data_frame["temp"] = data_frame.groupby(group_by_col).cumcount() + 1
+        data_frame["temp"] = (
+            data_frame.groupby(group_by_col, observed=True).cumcount() + 1
+        )
         # drop the old sequence column
         data_frame = data_frame.drop(columns=[seq_col], axis=1)
         # rename new column:
@@ -247,12 +913,14 @@ class Service_Utils(object):
         trips = list(set(trips))
         return trips
 
-    def __get_trips_stop_times(self):
+    @_derived("stop_times", "trips")
+    def _trip_stop_times(self):
         """
-        Creates a merged dataframe consisting of trips & stop_ids for the
-        start time, end time and service_id (from GTFS Calender.txt). This
-        can include partial itineraries as only stops within the start and
-        end time are included.
+        Merged dataframe consisting of trips & stop_ids for the start time,
+        end time and service_id (from GTFS Calender.txt). This can include
+        partial itineraries as only stops within the start and end time are
+        included. Becomes _df_all_stops_by_trips once the stop patterns
+        are known.
         """
         stop_times_df = self.__make_sequence_col(
             self.stop_times, ["trip_id", "stop_sequence"], "trip_id", "stop_sequence"
@@ -264,18 +932,14 @@ class Service_Utils(object):
 
         # Add columns for arrival/departure in decimal minutes and hours:
         # Some schedules only have arrival/departure times for time points,
-        # not all stops:
-        if stop_times_df["departure_time"].isnull().any():
-            stop_times_df["departure_time"].fillna("00:00:00", inplace=True)
-            stop_times_df["departure_time_mins"] = stop_times_df.apply(
-                self.__convert_to_decimal_minutes, axis=1, args=("departure_time",)
-            )
-            stop_times_df["departure_time_mins"].replace(0, NaN, inplace=True)
-            stop_times_df["departure_time_mins"].interpolate(inplace=True)
-        else:
-            stop_times_df["departure_time_mins"] = stop_times_df.apply(
-                self.__convert_to_decimal_minutes, axis=1, args=("departure_time",)
-            )
+        # not all stops, these are interpolated:
+        stop_times_df["departure_time_mins"] = (
+            hhmmss_to_seconds(stop_times_df["departure_time"]) / 60
+        )
+        if stop_times_df["departure_time_mins"].isnull().any():
+            stop_times_df["departure_time_mins"] = stop_times_df[
+                "departure_time_mins"
+            ].interpolate()
         stop_times_df["departure_time_hrs"] = stop_times_df["departure_time_mins"] / 60
         stop_times_df["departure_time_hrs"] = stop_times_df[
             "departure_time_hrs"
@@ -286,33 +950,35 @@ class Service_Utils(object):
 
         return stop_times_df
 
-    def __convert_to_decimal_minutes(self, row, field):
-        """
-        Convert HH:MM:SS to seconds since midnight
-        for comparison purposes.
-        """
-
-        H, M, S = row[field].split(":")
-        seconds = float(((float(H) * 3600) + (float(M) * 60) + float(S)) / 60)
-
-        return seconds
-
-    def __convert_to_seconds(self, row, field):
+    @_derived("_trip_stop_times", "schedule_pattern_df")
+    def _df_all_stops_by_trips(self):
         """
-        Converts from hhmmss format to seconds.
+        _trip_stop_times with the rep_trip_id of each trip's stop pattern.
         """
-        h, m, s = row[field].split(":")
-        return int(h) * 3600 + int(m) * 60 + int(s)
+        df = self._trip_stop_times.merge(
+            self.schedule_pattern_df[["orig_trip_id", "rep_trip_id"]],
+            how="left",
+            left_on="trip_id",
+            right_on="orig_trip_id",
+        ).drop(columns=["orig_trip_id"])
+        # only needed to build the stop patterns, which are built by now:
+        del self._trip_stop_times
+        return df
 
-    def __to_hhmmss(self, row, field):
+    def __get_stops_by_trips(self):
         """
-        Converts to hhmmss format.
+        Returns _df_all_stops_by_trips if it has been built, otherwise the
+        same rows without rep_trip_id, so callers that do not need the stop
+        patterns do not build them.
         """
-        return time.strftime("%H:%M:%S", time.gmtime(row[field]))
+        if "_df_all_stops_by_trips" in self.__dict__:
+            return self._df_all_stops_by_trips
+        return self._trip_stop_times
 
-    def __get_schedule_pattern(self, route_field="route_id"):
+    @_derived("_trip_stop_times")
+    def _schedule_pattern_dict(self, route_field="route_id"):
         """
-        Returns a nested diciontary where the first level key is route_id and
+        Nested diciontary where the first level key is route_id and
         values are respresentative trip_ids that have unique stop sequences.
         These are are used as keys for the second level where each value is a
         dictinary that includes a list of trips_id's that share this stop
@@ -322,44 +988,44 @@ class Service_Utils(object):
         [list of stops]}}
 
         """
-        stop_sequence_dict = {
-            k: list(v)
-            for k, v in self._df_all_stops_by_trips.groupby(["trip_id", route_field])[
-                "stop_id"
-            ]
-        }
+        df = self.__get_stops_by_trips()[["trip_id", route_field, "stop_id"]]
+        df = df.dropna(subset=["trip_id", route_field])
+        # stable sort keeps each trip's stops in stop_sequence order:
+        df = df.sort_values(["trip_id", route_field], kind="stable")
+
+        # Factorize stop_ids and turn each trip's stop sequence into a
+        # hashable tuple of codes so identical patterns can be grouped in
+        # one pass instead of comparing lists against every known pattern.
+        stop_codes, stop_ids = pd.factorize(df["stop_id"])
+        trip_ids = df["trip_id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, trip_ids[1:] != trip_ids[:-1]])
+        trip_patterns = pd.DataFrame(
+            {
+                "trip_id": trip_ids[starts],
+                "route_id": df[route_field].to_numpy()[starts],
+                "stops": [tuple(x) for x in np.split(stop_codes, starts[1:])],
+            }
+        )
+        # patterns are numbered in order of their first trip, which
+        # becomes the representative trip for the pattern:
+        trip_patterns["pattern"] = trip_patterns.groupby(
+            ["route_id", "stops"], sort=False, observed=True
+        ).ngroup()
 
-        # Empty dictionary to store unique stop sequences
         my_dict = {}
-        for key, value in stop_sequence_dict.items():
-            trip_id = key[0]
-            route_id = key[1]
-            # Handle some branching later on
-            found = False
-            # If this is the first trip for this route, just add it
-            if route_id not in my_dict.keys():
-                my_dict[route_id] = {trip_id: {"stops": value, "trip_ids": [trip_id]}}
-            # Otherwise check to see if this stop sequence has already been
-            # added for this route
-            else:
-                for k, v in my_dict[route_id].items():
-                    if value == v["stops"]:
-                        # This stop sequence has already been added for this
-                        # route, add the trip_id to the list of trip_ids that
-                        # have this sequence in common.
-                        my_dict[route_id][k]["trip_ids"].append(trip_id)
-                        found = True
-                        break
-                if not found:
-                    # Add the stop sequence and route, trip info
-                    my_dict[route_id][trip_id] = {"stops": value, "trip_ids": [trip_id]}
-            # Set back to False for next iteration
-            found = False
+        for _, trips in trip_patterns.groupby("pattern", sort=True):
+            route_id = trips["route_id"].iloc[0]
+            rep_trip_id = trips["trip_id"].iloc[0]
+            my_dict.setdefault(route_id, {})[rep_trip_id] = {
+                "stops": stop_ids[list(trips["stops"].iloc[0])].tolist(),
+                "trip_ids": trips["trip_id"].tolist(),
+            }
         return my_dict
 
-    def __get_schedule_pattern_df(self):
+    @_derived("_schedule_pattern_dict", "_trip_stop_times")
+    def schedule_pattern_df(self):
         """
-        Returns a DataFrame with a field for each trip_id used
+        DataFrame with a field for each trip_id used
         to represent a unique stop_pattern (rep_trip_id) and a
         column with the other trip_ids that share the same stop
         pattern
@@ -372,7 +1038,7 @@ class Service_Utils(object):
                         {"route_id": route_id, "trip_id1": trip_id, "trip_id2": trip}
                     )
         df2 = pd.DataFrame(rows)
-        df = self._df_all_stops_by_trips.drop_duplicates(["trip_id"])
+        df = self.__get_stops_by_trips().drop_duplicates(["trip_id"])
         df2 = df2.merge(
             df[["trip_id", "shape_id"]],
             how="right",
@@ -381,29 +1047,19 @@ class Service_Utils(object):
         )
         df2 = df2.rename(columns={"trip_id1": "rep_trip_id", "trip_id": "orig_trip_id"})
         df2 = df2.drop(columns=["trip_id2"])
+        if self.feed.compact_ids:
+            df2 = self.feed.encode_ids(df2)
         return df2
 
-    def frequencies_to_trips(self):
+    def __get_frequencies(self, trips):
         """
-        For each trip_id in frequencies.txt, calculates the number
-        of trips and creates records for each trip in trips.txt and
-        stop_times.txt. Deletes the original represetative trip_id
-        in both of these files.
+        Returns the records in frequencies.txt for trips with the number
+        of trips each one adds.
         """
-        frequencies = pd.read_csv(Path(f"{self.gtfs_dir}/frequencies.txt"))
-        frequencies = frequencies[frequencies["trip_id"].isin(self.trips["trip_id"])]
-
-        # some feeds will use the same trip_id for multiple rows
-        # need to create a unique id for each row
-        frequencies["frequency_id"] = frequencies.index
-
-        frequencies["start_time_secs"] = frequencies.apply(
-            self.__convert_to_seconds, axis=1, args=("start_time",)
-        )
-
-        frequencies["end_time_secs"] = frequencies.apply(
-            self.__convert_to_seconds, axis=1, args=("end_time",)
-        )
+        frequencies = self.feed.get_table("frequencies")
+        frequencies = frequencies[frequencies["trip_id"].isin(trips["trip_id"])].copy()
+        frequencies["start_time_secs"] = hhmmss_to_seconds(frequencies["start_time"])
+        frequencies["end_time_secs"] = hhmmss_to_seconds(frequencies["end_time"])
 
         # following is coded so the total number of trips
         # does not include a final one that leaves the first
@@ -426,90 +1082,117 @@ class Service_Utils(object):
             .round(0)
             .astype(int)
         )
+        return frequencies
 
-        trips_update = self.trips.merge(frequencies, on="trip_id")
-        trips_update = trips_update.loc[
-            trips_update.index.repeat(trips_update["total_trips"])
-        ].reset_index(drop=True)
-        trips_update["counter"] = trips_update.groupby("trip_id").cumcount() + 1
-        trips_update["trip_id"] = (
-            trips_update["trip_id"].astype(str)
+    def __get_frequency_trips(self, frequencies):
+        """
+        Returns three arrays with a record for each trip run by the rows
+        of frequencies: the position of its row in frequencies, the
+        number of headways after the row's start_time it leaves and its
+        trip_id. Each trip_id is the original one followed by the trip's
+        number among all trips run by that trip_id, e.g. 100_1, 100_2.
+        """
+        total_trips = frequencies["total_trips"].to_numpy()
+        rows = np.repeat(np.arange(len(frequencies)), total_trips)
+        headways = np.arange(len(rows)) - np.repeat(
+            np.cumsum(total_trips) - total_trips, total_trips
+        )
+        # trips of earlier rows for the same trip_id:
+        earlier = (
+            frequencies.groupby("trip_id", sort=False, observed=True)["total_trips"]
+            .cumsum()
+            .to_numpy()
+            - total_trips
+        )
+        trip_ids = (
+            pd.Series(frequencies["trip_id"].astype(str).to_numpy()[rows])
             + "_"
-            + trips_update["counter"].astype(str)
+            + pd.Series(earlier[rows] + headways + 1).astype(str)
         )
+        return rows, headways, trip_ids.to_numpy()
 
-        stop_times_update = frequencies.merge(self.stop_times, on="trip_id", how="left")
+    def __expand_frequency_trips(self, trips, frequencies):
+        """
+        Returns trips with a record for each trip run by the trip_ids in
+        frequencies in place of the original trip.
+        """
+        rows, _, trip_ids = self.__get_frequency_trips(frequencies)
+        templates = pd.Index(trips["trip_id"]).get_indexer(frequencies["trip_id"])
+        trips_update = trips.iloc[templates[rows]].reset_index(drop=True)
+        trips_update["trip_id"] = trip_ids
 
-        stop_times_update["arrival_time_secs"] = stop_times_update.apply(
-            self.__convert_to_seconds, axis=1, args=("arrival_time",)
-        )
-        stop_times_update["departure_time_secs"] = stop_times_update.apply(
-            self.__convert_to_seconds, axis=1, args=("departure_time",)
-        )
+        # remove trip_ids that are in frequencies
+        trips = trips[~trips["trip_id"].isin(frequencies["trip_id"])]
+        return pd.concat([trips, trips_update])
 
-        stop_times_update["elapsed_time"] = stop_times_update.groupby(
-            ["trip_id", "start_time"]
-        )["arrival_time_secs"].transform("first")
-        stop_times_update["elapsed_time"] = (
-            stop_times_update["arrival_time_secs"] - stop_times_update["elapsed_time"]
-        )
-        stop_times_update["arrival_time_secs"] = (
-            stop_times_update["start_time_secs"] + stop_times_update["elapsed_time"]
-        )
+    def __expand_frequency_stop_times(self, stop_times, frequencies):
+        """
+        Returns stop_times with records for each trip run by the trip_ids
+        in frequencies in place of the original trip. Each trip copies the
+        stops of its original trip, with times shifted so that the first
+        stop is at the frequency start_time plus a whole number of
+        headways. Times are worked out in seconds on arrays, one row per
+        stop of each new trip, and formatted once at the end.
+        """
+        is_template = stop_times["trip_id"].isin(frequencies["trip_id"]).to_numpy()
+        templates = stop_times[is_template]
+        # template rows grouped by trip, in the order of stop_times:
+        template_trips, template_trip_ids = pd.factorize(templates["trip_id"])
+        order = np.argsort(template_trips, kind="stable")
+        templates = templates.iloc[order]
+        template_trips = template_trips[order]
+        starts = np.searchsorted(template_trips, np.arange(len(template_trip_ids)))
+        lengths = np.diff(np.append(starts, len(templates)))
+
+        # seconds after the first stop of the trip with a time:
+        arrival_secs = pd.Series(hhmmss_to_seconds(templates["arrival_time"]))
+        elapsed = (
+            arrival_secs - arrival_secs.groupby(template_trips).transform("first")
+        ).to_numpy()
+
+        rows, headways, trip_ids = self.__get_frequency_trips(frequencies)
+        template = pd.Index(template_trip_ids).get_indexer(frequencies["trip_id"])
+        # frequency rows of trips without stop_times run no stops:
+        n_stops = np.where(template >= 0, lengths[template], 0)[rows]
+        trip_rows = np.repeat(np.arange(len(rows)), n_stops)
+        template_rows = np.repeat(
+            starts[template[rows]] - np.cumsum(n_stops) + n_stops, n_stops
+        ) + np.arange(n_stops.sum())
 
         # for now assume departure time is the same as arrival time.
-        stop_times_update["departure_time_secs"] = (
-            stop_times_update["start_time_secs"] + stop_times_update["elapsed_time"]
+        secs = (
+            frequencies["start_time_secs"].to_numpy()[rows]
+            + headways * frequencies["headway_secs"].to_numpy()[rows]
         )
+        secs = secs[trip_rows] + elapsed[template_rows]
+        times = seconds_to_hhmmss(secs)
 
-        stop_times_update = stop_times_update.loc[
-            stop_times_update.index.repeat(stop_times_update["total_trips"])
-        ].reset_index(drop=True)
-
-        # handles case of repeated trip_ids
-        stop_times_update["counter"] = stop_times_update.groupby(
-            ["frequency_id", "stop_id"]
-        ).cumcount()
-        stop_times_update["departure_time_secs"] = stop_times_update[
-            "departure_time_secs"
-        ] + (stop_times_update["counter"] * stop_times_update["headway_secs"])
-        stop_times_update["arrival_time_secs"] = stop_times_update[
-            "arrival_time_secs"
-        ] + (stop_times_update["counter"] * stop_times_update["headway_secs"])
-
-        # now we want to get the cumcount based on trip_id
-        stop_times_update["counter"] = (
-            stop_times_update.groupby(["trip_id", "stop_id"]).cumcount() + 1
-        )
-        stop_times_update["departure_time"] = stop_times_update.apply(
-            self.__to_hhmmss, axis=1, args=("departure_time_secs",)
-        )
-        stop_times_update["arrival_time"] = stop_times_update.apply(
-            self.__to_hhmmss, axis=1, args=("arrival_time_secs",)
-        )
-        stop_times_update["trip_id"] = (
-            stop_times_update["trip_id"].astype(str)
-            + "_"
-            + stop_times_update["counter"].astype(str)
-        )
+        stop_times_update = templates.iloc[template_rows].reset_index(drop=True)
+        stop_times_update["trip_id"] = trip_ids[trip_rows]
+        stop_times_update["arrival_time"] = times
+        stop_times_update["departure_time"] = times
 
         # remove trip_ids that are in frequencies
-        stop_times = self.stop_times[
-            ~self.stop_times["trip_id"].isin(frequencies["trip_id"])
-        ]
-
-        trips = self.trips[~self.trips["trip_id"].isin(frequencies["trip_id"])]
+        stop_times = stop_times[~is_template]
+        return pd.concat([stop_times, stop_times_update])
 
-        # get rid of some columns
-        stop_times_update = stop_times_update[stop_times.columns]
-        trips_update = trips_update[trips.columns]
-
-        # add new trips/stop times
-        trips = pd.concat([trips, trips_update])
-        stop_times = pd.concat([stop_times, stop_times_update])
-
-        return trips, stop_times
+    def frequencies_to_trips(self):
+        """
+        For each trip_id in frequencies.txt, calculates the number
+        of trips and creates records for each trip in trips.txt and
+        stop_times.txt. Deletes the original represetative trip_id
+        in both of these files.
+        """
+        trips = self.__get_trips()
+        frequencies = self.__get_frequencies(trips)
+        stop_times = self.feed.get_stop_times(trips["trip_id"])
+        return (
+            self.__expand_frequency_trips(trips, frequencies),
+            self.__expand_frequency_stop_times(stop_times, frequencies),
+        )
 
+    @_memoized
+    @_profiled
     def get_tph_by_line(self):
         """
         Returns a DataFrame with records for each rep_trip_id and
@@ -517,44 +1200,33 @@ class Service_Utils(object):
         with service. For example 2:00-3:00 AM is called hour_2 and
         3:00-4:00 PM is called hour_15.
         """
-        # get the first stop for every trip
-        first_departure = (
-            self._df_all_stops_by_trips.sort_values("stop_sequence", ascending=True)
-            .groupby("trip_id", as_index=False)
-            .first()
-        )
-        # this may not be necessary
-        first_departure = first_departure.loc[(first_departure.stop_sequence == 1)]
-        first_departure = first_departure.groupby(
-            ["rep_trip_id", "departure_time_hrs"]
-        )["departure_time_hrs"].count()
-        first_departure_df = pd.DataFrame(first_departure)
-        first_departure_df.reset_index(level=0, inplace=True)
-        first_departure_df = first_departure_df.rename(
-            columns={"departure_time_hrs": "frequency"}
-        )
-        first_departure_df.reset_index(level=0, inplace=True)
+        # the hour of the first stop of every trip:
+        first_departure_df = (
+            self.trip_summary.groupby(
+                ["rep_trip_id", "first_departure_hrs"], observed=True
+            )
+            .size()
+            .rename("frequency")
+            .reset_index()
+            .rename(columns={"first_departure_hrs": "departure_time_hrs"})
+        )
         t = pd.pivot_table(
             first_departure_df,
             values="frequency",
             index=["rep_trip_id"],
             columns=["departure_time_hrs"],
+            observed=True,
         )
         t = t.fillna(0)
         for col in t.columns:
             if not col == "rep_trip_id":
                 t = t.rename(columns={col: "hour_" + str(col)})
         t.reset_index(inplace=True)
-        t = t.merge(
-            self.trips[["route_id", "trip_id", "direction_id"]],
-            how="left",
-            left_on="rep_trip_id",
-            right_on="trip_id",
-        )
-        t.drop(columns=["trip_id"], axis=1, inplace=True)
-
-        return t
+        t.columns.name = None
+        return _decode_ids(self.__with_line_columns(t))
 
+    @_memoized
+    @_profiled
     def get_tph_at_stops(self):
         """
         Returns a DataFrame with records for each stop_id and
@@ -562,24 +1234,52 @@ class Service_Utils(object):
         with service. For example 2:00-3:00 AM is called hour_2 and
         3:00-4:00 PM is called hour_15.
         """
-        df = self._df_all_stops_by_trips.groupby(["stop_id", "departure_time_hrs"])[
-            "departure_time_hrs"
-        ].count()
+        df = (
+            self.__get_stops_by_trips()
+            .groupby(["stop_id", "departure_time_hrs"], observed=True)[
+                "departure_time_hrs"
+            ]
+            .count()
+        )
 
         df = pd.DataFrame(df)
         df.reset_index(level=0, inplace=True)
         df = df.rename(columns={"departure_time_hrs": "frequency"})
         df.reset_index(level=0, inplace=True)
         t = pd.pivot_table(
-            df, values="frequency", index=["stop_id"], columns=["departure_time_hrs"]
+            df,
+            values="frequency",
+            index=["stop_id"],
+            columns=["departure_time_hrs"],
+            observed=True,
         )
         t = t.fillna(0)
         for col in t.columns:
             if not col == "rep_trip_id":
                 t = t.rename(columns={col: "hour_" + str(col)})
         t.reset_index(inplace=True)
-        return t
+        return _decode_ids(t)
 
+    @_memoized
+    @_profiled
+    def get_headways_at_stops(self, bin_edges=None, by_route=False):
+        """
+        Returns a DataFrame with records for each stop_id, or each stop_id
+        and route_id if by_route, and time window with the number of trips
+        and the mean and maximum headway in minutes. bin_edges are the
+        window boundaries in minutes after midnight, e.g.
+        (360, 540, 900, 1140), and default to every hour with service.
+        Pass bin_edges as a tuple for the result to be memoized.
+        """
+        df = self.__get_stops_by_trips()
+        if bin_edges is None:
+            last_hour = int(df["departure_time_mins"].max() // 60) + 1
+            bin_edges = np.arange(last_hour + 1) * 60
+        keys = ["stop_id", "route_id"] if by_route else ["stop_id"]
+        return _decode_ids(get_headways(df, keys, bin_edges))
+
+    @_memoized
+    @_profiled
     def get_lines_gdf(self):
         """
         Returns a GeoDataFrame with records for each rep_trip_id and
@@ -588,26 +1288,28 @@ class Service_Utils(object):
         route_long_name, and route_desc.
         """
         if self.rep_trips_without_shapes:
-            print("WARNING: There are representative trips without shapes!")
-            print(
-                "WARNING: These trips will not be included in the returned GeodataFrame"
+            logger.warning(
+                "There are representative trips without shapes! These trips "
+                "will not be included in the returned GeodataFrame. Please see "
+                "the .rep_trips_without_shapes property for a list."
             )
-            print("Please see the .rep_trips_without_shapes property for a list")
 
-        rep_trips = self.trips[self.trips["trip_id"].isin(self.__rep_trip_list)]
+        rep_trips = self.trips[self.trips["trip_id"].isin(self._rep_trip_list)]
         rep_trips = rep_trips.merge(self.routes, how="left", on="route_id")
         rep_trips = self.shapes.merge(rep_trips, how="right", on="shape_id")
         rep_trips.rename(columns={"trip_id": "rep_trip_id"}, inplace=True)
         # assert rep_trips.geometry.hasnans == False
-        return rep_trips
+        return _decode_ids(rep_trips)
 
+    @_memoized
+    @_profiled
     def get_line_stops_gdf(self):
         """
         Returns a GeoDataFrame with records for each stop for each
         rep_trip_id.
         """
         route_stops = self._df_all_stops_by_trips[
-            self._df_all_stops_by_trips["trip_id"].isin(self.__rep_trip_list)
+            self._df_all_stops_by_trips["trip_id"].isin(self._rep_trip_list)
         ]
         route_stops = route_stops.merge(self.stops, how="left", on="stop_id")
         route_stops = gpd.GeoDataFrame(route_stops, geometry=route_stops["geometry"])
@@ -624,31 +1326,31 @@ class Service_Utils(object):
             inplace=True,
         )
         route_stops = route_stops.set_crs(epsg=self._crs_epsg)
-        return route_stops
+        return _decode_ids(route_stops)
 
+    @_memoized
+    @_profiled
     def get_line_time(self):
         """
         Returns a DataFrame with records for each rep_trip_id
         and their total service time.
         """
-        first = self._df_all_stops_by_trips.groupby(["trip_id"])[
-            "departure_time_mins"
-        ].first()
-        first.rename("first", inplace=True)
-
-        last = self._df_all_stops_by_trips.groupby(["trip_id"])[
-            "departure_time_mins"
-        ].last()
-        last.rename("last", inplace=True)
-
-        route_id = self._df_all_stops_by_trips.groupby(["trip_id"])[
-            "rep_trip_id", "route_id"
-        ].first()
-
-        df = pd.concat([route_id, first, last], axis=1).reset_index()
+        df = self.trip_summary[
+            [
+                "trip_id",
+                "rep_trip_id",
+                "route_id",
+                "first_departure_mins",
+                "last_departure_mins",
+            ]
+        ].rename(
+            columns={"first_departure_mins": "first", "last_departure_mins": "last"}
+        )
         df["total_line_time"] = df["last"] - df["first"]
-        return df
+        return _decode_ids(df)
 
+    @_memoized
+    @_profiled
     def get_service_hours_by_line(self):
         """
         Returns a DataFrame with records for each rep_trip_id and columns with
@@ -656,43 +1358,240 @@ class Service_Utils(object):
         For example 2:00-3:00 AM is called hour_2 and 3:00-4:00 PM is called
         hour_15.
         """
-        df = self.get_line_time()
-        df = df.groupby("rep_trip_id")["total_line_time"].sum().to_frame()
-        df.reset_index(inplace=True)
+        summary = self.trip_summary
+        df = (
+            (summary["last_departure_mins"] - summary["first_departure_mins"])
+            .groupby(summary["rep_trip_id"], observed=True)
+            .sum()
+            .rename("total_line_time")
+            .reset_index()
+        )
+        return _decode_ids(self.__with_line_columns(df))
+
+    def __trip_distances(self, units, shape_dist_units):
+        """
+        Returns trip_summary with the length of each trip's shape in units
+        as distance, NaN for trips without line geometry. Lengths come from
+        shape_dist_traveled, given in shape_dist_units, for shapes that
+        have it if shape_dist_units is passed, otherwise from the shape's
+        points.
+        """
+        for value in [units] + ([shape_dist_units] if shape_dist_units else []):
+            if value not in self.distance_units:
+                raise ValueError(
+                    f"units must be one of {list(self.distance_units)}, got {value!r}"
+                )
+        lengths = self._shape_lengths
+        meters = lengths["length"]
+        if shape_dist_units is not None:
+            shape_dist = lengths["shape_dist"] * self.distance_units[shape_dist_units]
+            meters = shape_dist.where(shape_dist.notna(), meters)
+        distances = pd.Series(
+            (meters / self.distance_units[units]).to_numpy(),
+            index=_decode_ids(lengths[["shape_id"]])["shape_id"],
+        )
+
+        trips = self.trip_summary.copy()
+        trips["distance"] = _decode_ids(trips[["shape_id"]])["shape_id"].map(distances)
+        if trips["distance"].isna().any():
+            logger.warning(
+                "There are trips without shapes! Their distance is left out "
+                "of service distances. Please see the .trips_without_shapes "
+                "property for a list."
+            )
+        return trips
+
+    @_memoized
+    @_profiled
+    def get_service_distance_by_line(self, units="miles", shape_dist_units=None):
+        """
+        Returns a DataFrame with records for each rep_trip_id and columns
+        with the length of its shape (line_distance), the number of trips
+        and the distance they travel in total (service_distance), in units
+        ("meters", "km", "feet" or "miles"). Shape lengths are computed
+        from the shape points, or taken from shape_dist_traveled where
+        shapes.txt has it if shape_dist_units gives its units, which
+        differ between feeds.
+        """
+        trips = self.__trip_distances(units, shape_dist_units)
+        rep_trips = trips[trips["trip_id"] == trips["rep_trip_id"]]
+        distance = trips.groupby("rep_trip_id", observed=True)["distance"]
+        df = pd.DataFrame(
+            {
+                "total_trips": distance.size(),
+                "service_distance": distance.sum(min_count=1),
+            }
+        ).reset_index()
         df = df.merge(
-            self.trips[["route_id", "trip_id", "direction_id"]],
+            rep_trips[["rep_trip_id", "distance"]].rename(
+                columns={"distance": "line_distance"}
+            ),
             how="left",
-            left_on="rep_trip_id",
-            right_on="trip_id",
+            on="rep_trip_id",
         )
+        df = self.__with_line_columns(df)
+        columns = [
+            "rep_trip_id",
+            "route_id",
+            "direction_id",
+            "line_distance",
+            "total_trips",
+            "service_distance",
+        ]
+        return _decode_ids(df[[col for col in columns if col in df.columns]])
 
-        return df[["rep_trip_id", "total_line_time", "route_id", "direction_id"]]
+    @_memoized
+    @_profiled
+    def get_service_distance_by_hour(self, units="miles", shape_dist_units=None):
+        """
+        Returns a DataFrame with records for each rep_trip_id and columns
+        with the distance traveled by the trips that start in each hour
+        after midnight with service, in units, like get_tph_by_line. See
+        get_service_distance_by_line.
+        """
+        trips = self.__trip_distances(units, shape_dist_units)
+        t = pd.pivot_table(
+            trips.rename(columns={"first_departure_hrs": "departure_time_hrs"}),
+            values="distance",
+            index=["rep_trip_id"],
+            columns=["departure_time_hrs"],
+            aggfunc="sum",
+            observed=True,
+        )
+        t = t.fillna(0)
+        t = t.rename(columns={col: f"hour_{col}" for col in t.columns})
+        t.reset_index(inplace=True)
+        t.columns.name = None
+        return _decode_ids(self.__with_line_columns(t))
 
+    @_memoized
+    @_profiled
     def get_routes_by_stops(self):
         """
         Returns a DataFrame with records for each rep_trip_id and a column
         holding a list of stops for each line.
         """
-        df = self._df_all_stops_by_trips[
-            self._df_all_stops_by_trips["trip_id"]
-            == self._df_all_stops_by_trips["rep_trip_id"]
-        ]
         df = pd.DataFrame(
-            df.groupby("stop_id")["route_id"].apply(lambda x: list(set(x.tolist())))
+            self._rep_trip_stops.groupby("stop_id", observed=True)["route_id"].apply(
+                lambda x: list(set(x.tolist()))
+            )
         )
         df.reset_index(inplace=True)
-        return df
+        return _decode_ids(df)
 
+    @_profiled
+    def get_stops_near(self, geometries, distance, crs=4326):
+        """
+        Returns a DataFrame with a record for each stop within distance
+        meters of each geometry, with the position of the geometry in
+        geometries (query), the stop_id and the distance in meters.
+        geometries is a GeoSeries or GeoDataFrame, an array of shapely
+        geometries or an array of (x, y) coordinates in crs. The stops are
+        held in an STRtree that is built once and reused by later queries.
+        """
+        geometries = self.__to_projected(geometries, crs)
+        query, stop = self._stop_index.query(
+            geometries, predicate="dwithin", distance=distance
+        )
+        stop_geometries = self._stop_index.geometries
+        df = pd.DataFrame(
+            {
+                "query": query,
+                "stop_id": self.stops["stop_id"].to_numpy()[stop],
+                "distance": shapely.distance(geometries[query], stop_geometries[stop]),
+            }
+        )
+        return _decode_ids(df.sort_values(["query", "distance"], ignore_index=True))
+
+    @_profiled
+    def get_raptor(self, max_walk_distance=400, walk_speed=80):
+        """
+        Returns a Raptor router over timetable with walking transfers
+        between stops up to max_walk_distance meters apart at walk_speed
+        meters per minute. Use its travel_time_matrix for stop to stop
+        travel times over a departure window.
+        """
+        pairs = self.get_stops_near(self.stops, max_walk_distance)
+        pairs["from_stop_id"] = _decode_ids(self.stops[["stop_id"]])[
+            "stop_id"
+        ].to_numpy()[pairs["query"]]
+        pairs = pairs[pairs["from_stop_id"] != pairs["stop_id"]]
+        transfers = pd.DataFrame(
+            {
+                "from_stop_id": pairs["from_stop_id"].astype(str),
+                "to_stop_id": pairs["stop_id"].astype(str),
+                "minutes": pairs["distance"] / walk_speed,
+            }
+        )
+        return Raptor(self.timetable, transfers)
+
+    @_profiled
+    def get_routes_near(self, geometries, distance=0, crs=4326, by="route_id"):
+        """
+        Returns a DataFrame with a record for each route_id, or rep_trip_id
+        if by="rep_trip_id", that serves a stop within distance meters of
+        each geometry, e.g. the routes serving each of a set of polygons.
+        geometries are passed as for get_stops_near and the position of
+        each one is in the query column.
+        """
+        stops = self.get_stops_near(geometries, distance, crs)
+        df = stops.merge(
+            _decode_ids(self._rep_trip_stops[["stop_id", by]].drop_duplicates()),
+            on="stop_id",
+        )
+        return (
+            df[["query", by]]
+            .drop_duplicates()
+            .sort_values(["query", by], ignore_index=True)
+        )
+
+    def __to_projected(self, geometries, crs):
+        """
+        Returns geometries as an array of shapely geometries in the CRS
+        used by the spatial queries.
+        """
+        if isinstance(geometries, gpd.GeoDataFrame):
+            geometries = geometries.geometry
+        if not isinstance(geometries, gpd.GeoSeries):
+            geometries = np.asarray(geometries)
+            if geometries.dtype != object:
+                geometries = shapely.points(geometries)
+            geometries = gpd.GeoSeries(geometries, crs=crs)
+        return geometries.to_crs(self._projected_crs).values.to_numpy()
+
+    @_memoized
+    @_profiled
     def get_total_trips_by_line(self):
         """
         Returns a DataFrame with records for each rep_trip_id and a column
         holding the total number of trips for each line.
         """
         df = (
-            self.schedule_pattern_df.groupby("rep_trip_id")
-            .count()
-            .reset_index()[["rep_trip_id", "orig_trip_id"]]
+            self.trip_summary.groupby("rep_trip_id", observed=True)
+            .size()
+            .rename("total_trips")
+            .reset_index()
         )
-        df = df.rename(columns={"orig_trip_id": "total_trips"})
-        df = df.merge(self.trips, how="left", left_on="rep_trip_id", right_on="trip_id")
-        return df[["rep_trip_id", "route_id", "direction_id", "total_trips"]]
+        df = self.__with_line_columns(df)
+        columns = ["rep_trip_id", "route_id", "direction_id", "total_trips"]
+        return _decode_ids(df[[col for col in columns if col in df.columns]])
+
+
+# derived attributes and the attributes each one is built from:
+Service_Utils._dependencies = {
+    name: attr.depends_on
+    for name, attr in vars(Service_Utils).items()
+    if isinstance(attr, _Derived)
+}
+
+
+def _haversine(lon1, lat1, lon2, lat2):
+    """
+    Returns the great circle distances in meters between arrays of points
+    in radians.
+    """
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
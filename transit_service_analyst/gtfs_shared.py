@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype
+
+from .gtfs_feed import GTFS_Feed
+
+
+def save_frame(df, directory):
+    """
+    Writes each column of df to directory as a .npy file that load_frame
+    can memory-map. Numeric columns are written as they are, other
+    columns as integer codes into sorted categories. ID columns of one
+    type, e.g. trip_id and rep_trip_id, share their categories so they
+    can still be compared. The index is not kept.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    coded = [
+        col
+        for col in df.columns
+        if not (is_numeric_dtype(df[col]) or is_bool_dtype(df[col]))
+        or isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    groups = {col: GTFS_Feed._id_columns.get(col, col) for col in coded}
+
+    categories = {}
+    for col, group in groups.items():
+        values = pd.Index(df[col].dropna().unique()).astype(str)
+        if group in categories:
+            values = categories[group].union(values)
+        categories[group] = values.sort_values()
+    for group, values in categories.items():
+        np.save(directory / f"categories.{group}.npy", values.to_numpy(dtype=str))
+
+    for i, col in enumerate(df.columns):
+        if col in groups:
+            dtype = pd.CategoricalDtype(categories[groups[col]])
+            values = pd.Categorical(df[col].astype(object).astype(str), dtype=dtype)
+            # keep missing values missing rather than the string "nan":
+            codes = np.where(df[col].isna().to_numpy(), -1, values.codes)
+            values = codes.astype(values.codes.dtype)
+        else:
+            values = df[col].to_numpy()
+        np.save(directory / f"{i}.npy", values)
+
+    with open(directory / "columns.json", "w") as f:
+        json.dump({"columns": list(df.columns), "groups": groups}, f)
+
+
+def load_frame(directory, mmap_mode="r"):
+    """
+    Returns the DataFrame written to directory by save_frame. By default
+    the columns are memory-mapped read-only without copying, so processes
+    that load the same directory share one copy through the page cache.
+    Coded columns are returned as pandas Categoricals.
+    """
+    directory = Path(directory)
+    with open(directory / "columns.json") as f:
+        meta = json.load(f)
+    groups = meta["groups"]
+    categories = {
+        group: np.load(directory / f"categories.{group}.npy").astype(object)
+        for group in set(groups.values())
+    }
+
+    columns = {}
+    for i, col in enumerate(meta["columns"]):
+        values = np.load(directory / f"{i}.npy", mmap_mode=mmap_mode)
+        if col in groups:
+            dtype = pd.CategoricalDtype(categories[groups[col]])
+            values = pd.Categorical.from_codes(values, dtype=dtype)
+        columns[col] = values
+    return pd.DataFrame(columns, copy=False)
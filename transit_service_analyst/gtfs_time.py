@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+# widest value handled by the fixed-width fast path, e.g. "08:15:00"
+_HHMMSS_WIDTH = 8
+# raw byte width read per value, leaves room for stray whitespace
+_RAW_WIDTH = 10
+_ZERO = ord("0")
+_COLON = ord(":")
+
+
+def hhmmss_to_seconds(times):
+    """
+    Converts GTFS HH:MM:SS strings to seconds after midnight. Hours
+    may be greater than 24 for trips that run past midnight and
+    single digit hours (H:MM:SS) are accepted. Missing or empty
+    values are returned as NaN. Returns a numpy float64 array.
+    """
+    values = pd.Series(times, dtype=object).to_numpy()
+    seconds = np.full(len(values), np.nan)
+    if not len(values):
+        return seconds
+
+    missing = pd.isna(values)
+    try:
+        raw = np.where(missing, "", values).astype(f"S{_RAW_WIDTH}")
+    except (UnicodeEncodeError, TypeError, ValueError):
+        return _parse_fallback(values, seconds)
+
+    lengths = np.char.str_len(raw)
+    # right align every value on its last 8 bytes so that H:MM:SS and
+    # HH:MM:SS share the same layout, left padding with zeros.
+    buffer = raw.view(np.uint8).reshape(-1, _RAW_WIDTH)
+    cols = lengths[:, None] - _HHMMSS_WIDTH + np.arange(_HHMMSS_WIDTH)
+    rows = np.arange(len(raw))[:, None]
+    chars = np.where(cols >= 0, buffer[rows, np.clip(cols, 0, None)], _ZERO)
+    digits = chars.astype(np.int64) - _ZERO
+
+    digit_cols = [0, 1, 3, 4, 6, 7]
+    well_formed = (
+        (chars[:, 2] == _COLON)
+        & (chars[:, 5] == _COLON)
+        & ((digits[:, digit_cols] >= 0) & (digits[:, digit_cols] <= 9)).all(axis=1)
+        & (lengths >= _HHMMSS_WIDTH - 1)
+        & (lengths <= _HHMMSS_WIDTH)
+    )
+    parsed = (
+        (digits[:, 0] * 10 + digits[:, 1]) * 3600
+        + (digits[:, 3] * 10 + digits[:, 4]) * 60
+        + digits[:, 6] * 10
+        + digits[:, 7]
+    )
+    seconds[well_formed] = parsed[well_formed]
+
+    # anything else (whitespace, 3 digit hours, fractional seconds, etc.)
+    # goes through the slower string split.
+    leftover = ~well_formed & ~missing & (lengths > 0)
+    if leftover.any():
+        seconds[leftover] = _parse_fallback(
+            values[leftover], np.full(leftover.sum(), np.nan)
+        )
+    return seconds
+
+
+def _parse_fallback(values, seconds):
+    """
+    Parses HH:MM:SS strings by splitting on ":". Values that can not be
+    parsed are returned as NaN.
+    """
+    parts = (
+        pd.Series(values, dtype=object)
+        .astype(str)
+        .str.strip()
+        .str.split(":", n=2, expand=True)
+        .reindex(columns=[0, 1, 2])
+    )
+    parts = parts.apply(pd.to_numeric, errors="coerce")
+    seconds[:] = (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=float)
+    return seconds
+
+
+def seconds_to_hhmmss(seconds):
+    """
+    Converts seconds after midnight to GTFS HH:MM:SS strings. Hours
+    are not wrapped at 24 so that trips running past midnight keep
+    times such as 25:10:00. Missing values are returned as None.
+    Returns a numpy object array.
+    """
+    values = np.asarray(pd.to_numeric(pd.Series(seconds), errors="coerce"), float)
+    out = np.full(len(values), None, dtype=object)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return out
+
+    secs = np.rint(values[valid]).astype(np.int64)
+    hours, rem = np.divmod(secs, 3600)
+    minutes, secs = np.divmod(rem, 60)
+
+    chars = np.full((len(secs), _HHMMSS_WIDTH), _COLON, dtype=np.uint8)
+    chars[:, 0], chars[:, 1] = np.divmod(hours % 100, 10)
+    chars[:, 3], chars[:, 4] = np.divmod(minutes, 10)
+    chars[:, 6], chars[:, 7] = np.divmod(secs, 10)
+    chars[:, [0, 1, 3, 4, 6, 7]] += _ZERO
+    formatted = chars.view(f"S{_HHMMSS_WIDTH}").ravel().astype(str).astype(object)
+
+    # hours of 100 or more do not fit in two digits
+    wide = (hours >= 100) | (hours < 0)
+    if wide.any():
+        formatted[wide] = [
+            f"{h:02d}:{m:02d}:{s:02d}"
+            for h, m, s in zip(hours[wide], minutes[wide], secs[wide])
+        ]
+    out[valid] = formatted
+    return out
@@ -0,0 +1,247 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+class Timetable(object):
+    """
+    Compact timetable of a service_date held in flat NumPy arrays with
+    offset indexes (CSR layout), for fast repeated queries:
+
+    - stop events by trip: the events of trip i are positions
+      trip_offsets[i]:trip_offsets[i + 1] of event_stops, event_times and
+      event_trips, in stop_sequence order.
+    - stop events by stop: stop_events[stop_offsets[s]:stop_offsets[s + 1]]
+      are the events at stop s ordered by departure time.
+    - patterns: pattern_stops[pattern_offsets[p]:pattern_offsets[p + 1]]
+      are the stops of pattern p and
+      pattern_trips[pattern_trip_offsets[p]:pattern_trip_offsets[p + 1]]
+      the trips that follow it.
+
+    Stops, trips and patterns are numbered by their position in stop_ids,
+    trip_ids and rep_trip_ids. Times are minutes after midnight. All
+    attributes are NumPy arrays, so a Timetable pickles cheaply and can be
+    saved and memory-mapped by several processes, see save and load.
+    """
+
+    _arrays = [
+        "stop_ids",
+        "trip_ids",
+        "rep_trip_ids",
+        "trip_offsets",
+        "trip_patterns",
+        "event_stops",
+        "event_times",
+        "event_trips",
+        "stop_offsets",
+        "stop_events",
+        "stop_event_keys",
+        "pattern_offsets",
+        "pattern_stops",
+        "pattern_trip_offsets",
+        "pattern_trips",
+    ]
+
+    def __init__(self, **arrays):
+        """
+        Use from_stops_by_trips or load to create a Timetable.
+        """
+        for name in self._arrays:
+            setattr(self, name, arrays[name])
+        # separates the stops in stop_event_keys:
+        self._stop_span = float(np.nanmax(self.event_times, initial=0)) + 1
+
+    @classmethod
+    def from_stops_by_trips(cls, df):
+        """
+        Returns a Timetable built from a DataFrame with a record for each
+        stop of each trip with trip_id, rep_trip_id, stop_id, stop_sequence
+        and departure_time_mins, such as Service_Utils
+        _df_all_stops_by_trips.
+        """
+        df = df[["trip_id", "rep_trip_id", "stop_id", "stop_sequence"]].assign(
+            departure_time_mins=df["departure_time_mins"]
+        )
+        df = df.dropna(subset=["trip_id", "rep_trip_id", "stop_id"])
+        df = df.sort_values(["trip_id", "stop_sequence"], kind="stable")
+
+        trips, trip_ids = pd.factorize(df["trip_id"].astype(str))
+        event_stops, stop_ids = pd.factorize(df["stop_id"].astype(str), sort=True)
+        event_patterns, rep_trip_ids = pd.factorize(
+            df["rep_trip_id"].astype(str), sort=True
+        )
+        event_times = df["departure_time_mins"].to_numpy(dtype=float)
+        n_events = len(df)
+        trip_starts = np.flatnonzero(np.diff(trips, prepend=-1))
+        trip_offsets = np.append(trip_starts, n_events)
+        trip_patterns = event_patterns[trip_starts]
+
+        # events at each stop by time, events without a time are left out:
+        timed = np.flatnonzero(~np.isnan(event_times))
+        stop_events = timed[np.lexsort([event_times[timed], event_stops[timed]])]
+        stop_offsets = np.searchsorted(
+            event_stops[stop_events], np.arange(len(stop_ids) + 1)
+        )
+        stop_span = float(np.nanmax(event_times, initial=0)) + 1
+        stop_event_keys = (
+            event_stops[stop_events] * stop_span + event_times[stop_events]
+        )
+
+        # the stops of each pattern are those of its representative trip:
+        rep_trips = pd.Index(trip_ids).get_indexer(rep_trip_ids)
+        pattern_lengths = trip_offsets[rep_trips + 1] - trip_offsets[rep_trips]
+        pattern_offsets = np.append(0, np.cumsum(pattern_lengths))
+        pattern_stops = event_stops[
+            np.repeat(trip_offsets[rep_trips] - pattern_offsets[:-1], pattern_lengths)
+            + np.arange(pattern_offsets[-1])
+        ]
+        pattern_trips = np.argsort(trip_patterns, kind="stable")
+        pattern_trip_offsets = np.searchsorted(
+            trip_patterns[pattern_trips], np.arange(len(rep_trip_ids) + 1)
+        )
+
+        return cls(
+            stop_ids=np.asarray(stop_ids, dtype=str),
+            trip_ids=np.asarray(trip_ids, dtype=str),
+            rep_trip_ids=np.asarray(rep_trip_ids, dtype=str),
+            trip_offsets=trip_offsets.astype(np.int64),
+            trip_patterns=trip_patterns.astype(np.int32),
+            event_stops=event_stops.astype(np.int32),
+            event_times=event_times,
+            event_trips=trips.astype(np.int32),
+            stop_offsets=stop_offsets.astype(np.int64),
+            stop_events=stop_events.astype(np.int64),
+            stop_event_keys=stop_event_keys,
+            pattern_offsets=pattern_offsets.astype(np.int64),
+            pattern_stops=pattern_stops.astype(np.int32),
+            pattern_trip_offsets=pattern_trip_offsets.astype(np.int64),
+            pattern_trips=pattern_trips.astype(np.int32),
+        )
+
+    def save(self, directory):
+        """
+        Writes each array to directory as a .npy file.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self._arrays:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Returns the Timetable saved in directory. By default the arrays are
+        memory-mapped read-only, so processes that load the same directory
+        share one copy through the page cache.
+        """
+        directory = Path(directory)
+        return cls(
+            **{
+                name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+                for name in cls._arrays
+            }
+        )
+
+    def stop_index(self, stop_ids):
+        """
+        Returns the positions of stop_ids in stop_ids, -1 for unknown ones.
+        """
+        return pd.Index(self.stop_ids).get_indexer(np.asarray(stop_ids, dtype=str))
+
+    def next_departure_events(self, stops, times):
+        """
+        Returns the index of the first event at or after times at each of
+        stops (positions in stop_ids), -1 where there is none. Vectorized
+        over stops and times.
+        """
+        stops = np.asarray(stops)
+        times = np.asarray(times, dtype=float)
+        if not len(self.stop_events):
+            return np.full(np.broadcast(stops, times).shape, -1, dtype=np.int64)
+        known = stops >= 0
+        stops = np.where(known, stops, 0)
+        position = np.searchsorted(
+            self.stop_event_keys, stops * self._stop_span + times, side="left"
+        )
+        found = known & (position < self.stop_offsets[stops + 1])
+        position = np.minimum(position, len(self.stop_events) - 1)
+        return np.where(found, self.stop_events[position], -1)
+
+    def next_departures(self, stop_ids, times):
+        """
+        Returns a DataFrame with the trip_id and departure_time_mins of
+        the next departure at or after each time (minutes after midnight)
+        from each of stop_ids. Both are NaN where there is none.
+        """
+        events = self.next_departure_events(self.stop_index(stop_ids), times)
+        found = events >= 0
+        trip_ids = np.full(events.shape, None, dtype=object)
+        trip_ids[found] = self.trip_ids[self.event_trips[events[found]]]
+        departure_times = np.full(events.shape, np.nan)
+        departure_times[found] = self.event_times[events[found]]
+        return pd.DataFrame(
+            {
+                "stop_id": np.asarray(stop_ids),
+                "time": times,
+                "trip_id": trip_ids,
+                "departure_time_mins": departure_times,
+            }
+        )
+
+    def __pattern_of(self, positions):
+        """
+        Returns the pattern of each of positions in pattern_stops.
+        """
+        return np.searchsorted(self.pattern_offsets, positions, side="right") - 1
+
+    def in_vehicle_times(self, from_stop_id, to_stop_id):
+        """
+        Returns a DataFrame with a record for each pattern that serves
+        from_stop_id and then to_stop_id, with its rep_trip_id, the number
+        of trips and the mean, minimum and maximum minutes between the two
+        stops over those trips.
+        """
+        from_stop, to_stop = self.stop_index([from_stop_id, to_stop_id])
+        from_at = np.flatnonzero(self.pattern_stops == from_stop)
+        to_at = np.flatnonzero(self.pattern_stops == to_stop)
+        # first visit of to_stop after each visit of from_stop:
+        after = np.searchsorted(to_at, from_at, side="right")
+        valid = after < len(to_at)
+        from_at = from_at[valid]
+        to_at = to_at[after[valid]]
+        patterns = self.__pattern_of(from_at)
+        same = self.__pattern_of(to_at) == patterns
+        patterns, first = np.unique(patterns[same], return_index=True)
+        from_at = from_at[same][first]
+        to_at = to_at[same][first]
+
+        # offset of both stops within each trip of the pattern:
+        starts = self.pattern_offsets[patterns]
+        n_trips = (
+            self.pattern_trip_offsets[patterns + 1]
+            - self.pattern_trip_offsets[patterns]
+        )
+        trips = self.pattern_trips[
+            np.repeat(self.pattern_trip_offsets[patterns], n_trips)
+            + np.arange(n_trips.sum())
+            - np.repeat(np.cumsum(n_trips) - n_trips, n_trips)
+        ]
+        first_event = self.trip_offsets[trips]
+        minutes = (
+            self.event_times[first_event + np.repeat(to_at - starts, n_trips)]
+            - self.event_times[first_event + np.repeat(from_at - starts, n_trips)]
+        )
+        df = pd.DataFrame(
+            {"pattern": np.repeat(np.arange(len(patterns)), n_trips), "t": minutes}
+        )
+        stats = df.groupby("pattern")["t"].agg(["mean", "min", "max"])
+        return pd.DataFrame(
+            {
+                "rep_trip_id": self.rep_trip_ids[patterns].astype(object),
+                "trips": n_trips,
+                "mean_in_vehicle_time": stats["mean"].to_numpy(),
+                "min_in_vehicle_time": stats["min"].to_numpy(),
+                "max_in_vehicle_time": stats["max"].to_numpy(),
+            }
+        )
@@ -1,6 +1,54 @@
-from .gtfs_service import Service_Utils
+from .gtfs_cache import Feed_Cache
+from .gtfs_feed import GTFS_Feed
 
 
-def load_gtfs(gtfs_dir, service_date):
-    gtfs_service = Service_Utils(gtfs_dir, service_date)
-    return gtfs_service
+def load_gtfs(
+    gtfs_dir,
+    service_date,
+    cache_dir=None,
+    cache_max_bytes=None,
+    chunk_size=None,
+    engine="c",
+    compact_ids=False,
+    defer_shapes=False,
+    profiler=None,
+    validation="full",
+):
+    """
+    Returns a Service_Utils instance for the GTFS files in gtfs_dir, which
+    may also be a GTFS zip file or file-like object, and service_date
+    (YYYYMMDD). If cache_dir is given the parsed tables are
+    stored there and reused by later calls for the same, unchanged files
+    and service_date. cache_max_bytes bounds the size of cache_dir, least
+    recently used entries are removed first. chunk_size streams
+    stop_times.txt in chunks of that many rows, keeping only the rows for
+    service_date, to bound peak memory on large feeds. engine selects the
+    CSV reader and compact_ids stores ID columns as shared Categoricals
+    to save memory on large feeds, see GTFS_Feed. Tables other than the
+    calendars and trips are read the first time they are used, see
+    Service_Utils.warm. defer_shapes leaves line geometry out of warm.
+    profiler is an optional Stage_Profiler, e.g. one that measures memory
+    or forwards each stage to a callback, see Service_Utils.timing_report.
+    validation selects how thoroughly the tables are validated: "full",
+    "fast", "sample" or "off", see GTFS_Feed. With cache_dir, files that
+    have passed validation are not validated again.
+
+    To analyze several service dates of the same feed use GTFS_Feed,
+    which reads the files once.
+    """
+    cache = None
+    if cache_dir is not None:
+        cache = Feed_Cache(cache_dir, max_bytes=cache_max_bytes)
+    # the full tables are not needed once the service_date has taken its
+    # rows from them:
+    feed = GTFS_Feed(
+        gtfs_dir,
+        chunk_size=chunk_size,
+        engine=engine,
+        compact_ids=compact_ids,
+        keep_tables=False,
+        profiler=profiler,
+        validation=validation,
+        validation_cache=cache,
+    )
+    return feed.get_service(service_date, cache, defer_shapes)